@@ -6,25 +6,46 @@ from pants.core.goals.lint import LintResult, LintTargetsRequest, Partitions
 from pants.core.util_rules.partitions import Partition
 from pants.core.util_rules.source_files import SourceFiles
 from pants.engine.addresses import Address
-from pants.engine.platform import Platform
 from pants.engine.process import FallibleProcessResult
 from pants.engine.rules import Get, MultiGet, collect_rules, rule
 from pants.engine.target import FieldSet
+from pants.engine.unions import UnionRule
 from pants.util.logging import LogLevel
 
 from pants_cargo_porcelain.backends.clippy.subsystem import ClippySubsystem
-from pants_cargo_porcelain.internal.platform import platform_to_target
-from pants_cargo_porcelain.subsystems import RustupTool
-from pants_cargo_porcelain.target_types import CargoPackageNameField, _CargoPackageMarker
+from pants_cargo_porcelain.target_types import (
+    CargoAllFeaturesField,
+    CargoDefaultFeaturesField,
+    CargoFeaturesField,
+    CargoPackageNameField,
+    _CargoPackageMarker,
+)
 from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
-from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
+from pants_cargo_porcelain.util_rules.rustup import (
+    CargoToolchainRequest,
+    RustToolchain,
+    RustToolchainComponents,
+)
 from pants_cargo_porcelain.util_rules.sandbox import CargoSourcesRequest
+from pants_cargo_porcelain.util_rules.workspace import (
+    CargoTargetCachePath,
+    CargoTargetCachePathRequest,
+)
 
 
 @dataclass(frozen=True)
 class CargoClippyFieldSet(FieldSet):
     required_fields = (CargoPackageNameField, _CargoPackageMarker)
 
+    features: CargoFeaturesField
+    default_features: CargoDefaultFeaturesField
+    all_features: CargoAllFeaturesField
+
+
+class ClippyToolchainComponents(RustToolchainComponents):
+    components = ("clippy",)
+
 
 class CargoClippyRequest(LintTargetsRequest):
     field_set_type = CargoClippyFieldSet
@@ -65,18 +86,27 @@ async def partition(
 async def run_cargo_lint(
     request: CargoClippyRequest.Batch[CargoClippyFieldSet, PackageMetadata],
     cargo_subsystem: ClippySubsystem,
-    rustup_tool: RustupTool,
     clippy: ClippySubsystem,
-    platform: Platform,
 ) -> LintResult:
-    toolchain, source_files = await MultiGet(
+    features = CargoFeatures.from_fields(
+        request.elements[0].features,
+        request.elements[0].default_features,
+        request.elements[0].all_features,
+    )
+    # Clippy's check artifacts are fingerprinted differently from those of regular builds, so
+    # they get a target directory of their own instead of invalidating the one of builds.
+    toolchain, source_files, cache_path = await MultiGet(
         Get(
             RustToolchain,
-            RustToolchainRequest(
-                rustup_tool.rust_version, platform_to_target(platform), ("cargo", "rustfmt")
-            ),
+            CargoToolchainRequest(request.elements[0].address),
         ),
         Get(SourceFiles, CargoSourcesRequest(frozenset([request.elements[0].address]))),
+        Get(
+            CargoTargetCachePath,
+            CargoTargetCachePathRequest(
+                request.elements[0].address, features=features, qualifier="clippy"
+            ),
+        ),
     )
 
     cargo_toml_path = f"{request.partition_metadata.address.spec_path}/Cargo.toml"
@@ -90,9 +120,12 @@ async def run_cargo_lint(
                 "--locked",
                 "--color=always",
                 f"--manifest-path={cargo_toml_path}",
+                *features.args,
                 *clippy.args,
             ),
             source_files.snapshot.digest,
+            cache_path=cache_path.path,
+            compiler_cache=True,
         ),
     )
 
@@ -103,4 +136,5 @@ def rules():
     return [
         *collect_rules(),
         *CargoClippyRequest.rules(),
+        UnionRule(RustToolchainComponents, ClippyToolchainComponents),
     ]
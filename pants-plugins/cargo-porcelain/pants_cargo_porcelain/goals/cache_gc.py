@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import logging
+
+from pants.core.util_rules.adhoc_binaries import PythonBuildStandaloneBinary
+from pants.engine.fs import CreateDigest, Digest, FileContent
+from pants.engine.goal import Goal, GoalSubsystem
+from pants.engine.process import Process, ProcessCacheScope, ProcessResult
+from pants.engine.rules import Get, collect_rules, goal_rule
+from pants.option.option_types import MemorySizeOption
+from pants.util.logging import LogLevel
+from pants.util.strutil import softwrap
+
+from pants_cargo_porcelain.util_rules.cargo import CARGO_TARGET_CACHE
+
+logger = logging.getLogger(__name__)
+
+_GC_SCRIPT_PATH = "__cargo_cache_gc.py"
+# Every directory in the target cache that cargo tagged with `CACHEDIR.TAG` is a target directory,
+# i.e. a `{cache_path}` or one of its `.slot-N` shards. A target directory is evicted as a whole,
+# along with the `.db` file `cargo-mtime` keeps next to it, least recently used first.
+_GC_SCRIPT = """\
+import json
+import os
+import shutil
+import sys
+
+
+def measure(path):
+    size = 0
+    last_used = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            stat = os.lstat(os.path.join(dirpath, filename))
+            size += stat.st_size
+            last_used = max(last_used, stat.st_atime, stat.st_mtime)
+    return size, last_used
+
+
+def main(root, max_size):
+    units = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "CACHEDIR.TAG" in filenames:
+            dirnames.clear()
+            size, last_used = measure(dirpath)
+            db = f"{dirpath}.db"
+            if os.path.isfile(db):
+                size += os.lstat(db).st_size
+            units.append((last_used, size, dirpath))
+
+    total = sum(size for _, size, _ in units)
+    evicted = []
+    for _, size, path in sorted(units):
+        if total <= max_size:
+            break
+        shutil.rmtree(path)
+        if os.path.isfile(f"{path}.db"):
+            os.remove(f"{path}.db")
+        total -= size
+        evicted.append(os.path.relpath(path, root))
+
+    json.dump({"evicted": evicted, "size": total, "kept": len(units) - len(evicted)}, sys.stdout)
+
+
+main(sys.argv[1], int(sys.argv[2]))
+"""
+
+
+class CargoCacheGcSubsystem(GoalSubsystem):
+    name = "cargo-cache-gc"
+    help = softwrap(f"""
+        Evict the least recently used target directories from the `{CARGO_TARGET_CACHE}` named
+        cache until it fits in `max_target_cache_size`.
+
+        Run it on its own, or after other goals to collect garbage at the end of a run, e.g.
+        `pants package :: cargo-cache-gc`. The `sccache` cache is bounded by
+        `[sccache].cache_size` instead.
+        """)
+
+    max_target_cache_size = MemorySizeOption(
+        default=20 * 1024 * 1024 * 1024,
+        help=softwrap("""
+            The size the target cache is shrunk to. Target directories of packages, workspaces
+            and shards are evicted as a whole.
+            """),
+    )
+
+
+class CargoCacheGc(Goal):
+    subsystem_cls = CargoCacheGcSubsystem
+    environment_behavior = Goal.EnvironmentBehavior.LOCAL_ONLY
+
+
+@goal_rule
+async def cargo_cache_gc(
+    subsystem: CargoCacheGcSubsystem, python: PythonBuildStandaloneBinary
+) -> CargoCacheGc:
+    input_digest = await Get(
+        Digest, CreateDigest([FileContent(_GC_SCRIPT_PATH, _GC_SCRIPT.encode())])
+    )
+
+    process_result = await Get(
+        ProcessResult,
+        Process(
+            argv=(
+                python.path,
+                _GC_SCRIPT_PATH,
+                CARGO_TARGET_CACHE,
+                str(subsystem.max_target_cache_size),
+            ),
+            input_digest=input_digest,
+            description="Collect garbage in the cargo target cache",
+            level=LogLevel.DEBUG,
+            append_only_caches={"ctc": CARGO_TARGET_CACHE, **python.APPEND_ONLY_CACHES},
+            immutable_input_digests=python.immutable_input_digests,
+            cache_scope=ProcessCacheScope.PER_SESSION,
+        ),
+    )
+
+    summary = json.loads(process_result.stdout)
+    for path in summary["evicted"]:
+        logger.debug(f"Evicted {path} from the cargo target cache")
+    logger.info(
+        f"Evicted {len(summary['evicted'])} target directories from the cargo target cache, kept"
+        f" {summary['kept']} ({summary['size'] / (1024 * 1024):.0f} MiB)."
+    )
+
+    return CargoCacheGc(exit_code=0)
+
+
+def rules():
+    return [
+        *collect_rules(),
+    ]
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+from pants_cargo_porcelain.goals.cache_gc import _GC_SCRIPT
+
+
+def write_target_dir(root, cache_path: str, size: int, last_used: int) -> None:
+    target_dir = root / cache_path
+    (target_dir / "debug").mkdir(parents=True)
+    (target_dir / "CACHEDIR.TAG").write_text("")
+    (target_dir / "debug" / "app").write_bytes(b"x" * size)
+    (root / f"{cache_path}.db").write_text("")
+    for path in (target_dir / "CACHEDIR.TAG", target_dir / "debug" / "app"):
+        os.utime(path, (last_used, last_used))
+
+
+def run_gc(root, max_size: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _GC_SCRIPT, str(root), str(max_size)],
+        check=True,
+        capture_output=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_evicts_least_recently_used_target_dirs(tmp_path) -> None:
+    write_target_dir(tmp_path, "old", 100, 1000)
+    write_target_dir(tmp_path, "ws/member.slot-1", 100, 2000)
+    write_target_dir(tmp_path, "ws/member", 100, 3000)
+
+    summary = run_gc(tmp_path, 250)
+
+    assert summary == {"evicted": ["old"], "size": 200, "kept": 2}
+    assert not (tmp_path / "old").exists()
+    assert not (tmp_path / "old.db").exists()
+    assert (tmp_path / "ws/member.slot-1").exists()
+    assert (tmp_path / "ws/member").exists()
+
+
+def test_keeps_everything_under_the_limit(tmp_path) -> None:
+    write_target_dir(tmp_path, "pkg", 100, 1000)
+
+    assert run_gc(tmp_path, 1000) == {"evicted": [], "size": 100, "kept": 1}
@@ -11,16 +11,17 @@ from pants.core.goals.generate_lockfiles import (
     WrappedGenerateLockfile,
 )
 from pants.core.util_rules.source_files import SourceFiles
-from pants.engine.platform import Platform
 from pants.engine.process import ProcessResult
 from pants.engine.rules import Get, MultiGet, collect_rules, rule
 from pants.engine.unions import UnionRule
 
-from pants_cargo_porcelain.internal.build import platform_to_target
-from pants_cargo_porcelain.subsystems import RustupTool
-from pants_cargo_porcelain.target_types import CargoPackageTarget, CargoWorkspaceTarget
+from pants_cargo_porcelain.target_types import (
+    CargoPackageTarget,
+    CargoRustVersionField,
+    CargoWorkspaceTarget,
+)
 from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
-from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
+from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainPinRequest
 from pants_cargo_porcelain.util_rules.sandbox import CargoSourcesRequest
 from pants_cargo_porcelain.util_rules.workspace import (
     AllCargoTargets,
@@ -86,13 +87,8 @@ def wrap_workspace_lockfile_request(
 @rule
 async def generate_rust_workspace_lockfile(
     req: GenerateCargoWorkspaceLockfileRequest,
-    rustup: RustupTool,
-    platform: Platform,
 ) -> GenerateLockfileResult:
-    toolchain = await Get(
-        RustToolchain,
-        RustToolchainRequest(rustup.rust_version, platform_to_target(platform), ("cargo",)),
-    )
+    toolchain = await Get(RustToolchain, RustToolchainPinRequest(req.workspace.address.spec_path))
 
     source_files = await Get(SourceFiles, CargoSourcesRequest(frozenset([req.workspace.address])))
 
@@ -122,13 +118,13 @@ async def generate_rust_workspace_lockfile(
 @rule
 async def generate_rust_package_lockfile(
     req: GenerateCargoPackageLockfileRequest,
-    rustup: RustupTool,
-    platform: Platform,
 ) -> GenerateLockfileResult:
     toolchain, source_files = await MultiGet(
         Get(
             RustToolchain,
-            RustToolchainRequest(rustup.rust_version, platform_to_target(platform), ("cargo",)),
+            RustToolchainPinRequest(
+                req.package.address.spec_path, req.package[CargoRustVersionField].value
+            ),
         ),
         Get(SourceFiles, CargoSourcesRequest(frozenset([req.package.address]))),
     )
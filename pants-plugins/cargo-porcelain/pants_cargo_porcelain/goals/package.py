@@ -11,15 +11,19 @@ from pants.core.goals.package import (
 )
 from pants.core.goals.run import RunFieldSet, RunInSandboxBehavior
 from pants.core.util_rules.environments import EnvironmentField
-from pants.engine.fs import AddPrefix, Digest
-from pants.engine.internals.selectors import Get
+from pants.engine.fs import AddPrefix, Digest, MergeDigests
+from pants.engine.internals.selectors import Get, MultiGet
 from pants.engine.rules import collect_rules, rule
 from pants.engine.unions import UnionRule
 from pants.util.logging import LogLevel
 
 from pants_cargo_porcelain.internal.build import CargoBinary, CargoBinaryRequest
 from pants_cargo_porcelain.subsystems import RustSubsystem
-from pants_cargo_porcelain.target_types import CargoBinaryNameField, CargoPackageSourcesField
+from pants_cargo_porcelain.target_types import (
+    CargoBinaryNameField,
+    CargoPackageSourcesField,
+    CargoTargetTriplesField,
+)
 
 
 @dataclass(frozen=True)
@@ -30,6 +34,7 @@ class CargoBinaryFieldSet(PackageFieldSet, RunFieldSet):
     binary_name: CargoBinaryNameField
     sources: CargoPackageSourcesField
     output_path: OutputPathField
+    target_triples: CargoTargetTriplesField
     environment: EnvironmentField
 
 
@@ -39,15 +44,46 @@ async def package_cargo_binary(
     rust: RustSubsystem,
 ) -> BuiltPackage:
     output_filename = PurePath(field_set.output_path.value_or_default(file_ending=None))
-    binary = await Get(
-        CargoBinary,
-        CargoBinaryRequest(field_set.address, field_set.sources, field_set.binary_name.value),
-    )
+    if not field_set.target_triples.value:
+        binary = await Get(
+            CargoBinary,
+            CargoBinaryRequest(field_set.address, field_set.sources, field_set.binary_name.value),
+        )
 
-    renamed_output_digest = await Get(Digest, AddPrefix(binary.digest, str(output_filename.parent)))
+        renamed_output_digest = await Get(
+            Digest, AddPrefix(binary.digest, str(output_filename.parent))
+        )
 
-    artifact = BuiltPackageArtifact(relpath=str(output_filename))
-    return BuiltPackage(renamed_output_digest, (artifact,))
+        artifact = BuiltPackageArtifact(relpath=str(output_filename))
+        return BuiltPackage(renamed_output_digest, (artifact,))
+
+    # Every target triple gets its own directory next to where the host binary would go.
+    target_triples = field_set.target_triples.value
+    binaries = await MultiGet(
+        Get(
+            CargoBinary,
+            CargoBinaryRequest(
+                field_set.address,
+                field_set.sources,
+                field_set.binary_name.value,
+                target_triple=target_triple,
+            ),
+        )
+        for target_triple in target_triples
+    )
+    renamed_output_digests = await MultiGet(
+        Get(Digest, AddPrefix(binary.digest, str(output_filename.parent / target_triple)))
+        for binary, target_triple in zip(binaries, target_triples)
+    )
+    output_digest = await Get(Digest, MergeDigests(renamed_output_digests))
+
+    artifacts = tuple(
+        BuiltPackageArtifact(
+            relpath=str(output_filename.parent / target_triple / output_filename.name)
+        )
+        for target_triple in target_triples
+    )
+    return BuiltPackage(output_digest, artifacts)
 
 
 def rules():
@@ -1,19 +1,27 @@
 import os.path
 
-from pants.core.goals.package import BuiltPackage, PackageFieldSet
 from pants.core.goals.run import RunRequest
 from pants.engine.internals.selectors import Get
 from pants.engine.rules import collect_rules, rule
 
 from pants_cargo_porcelain.goals.package import CargoBinaryFieldSet
+from pants_cargo_porcelain.internal.build import CargoBinary, CargoBinaryRequest
 
 
 @rule
 async def create_cargo_binary_run_request(field_set: CargoBinaryFieldSet) -> RunRequest:
-    binary = await Get(BuiltPackage, PackageFieldSet, field_set)
-    artifact_relpath = binary.artifacts[0].relpath
-    assert artifact_relpath is not None
-    return RunRequest(digest=binary.digest, args=(os.path.join("{chroot}", artifact_relpath),))
+    # Always run a binary built for the host, even if it is packaged for other target triples. Only
+    # the binary that is run is built.
+    binary = await Get(
+        CargoBinary,
+        CargoBinaryRequest(
+            field_set.address, field_set.sources, field_set.binary_name.value, batch=False
+        ),
+    )
+    return RunRequest(
+        digest=binary.digest,
+        args=(os.path.join("{chroot}", field_set.binary_name.value),),
+    )
 
 
 def rules():
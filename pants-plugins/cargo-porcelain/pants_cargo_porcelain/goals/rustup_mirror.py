@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+
+import toml
+from pants.core.util_rules.adhoc_binaries import PythonBuildStandaloneBinary
+from pants.engine.fs import (
+    CreateDigest,
+    Digest,
+    DigestContents,
+    FileContent,
+    MergeDigests,
+    RemovePrefix,
+    Workspace,
+)
+from pants.engine.goal import Goal, GoalSubsystem
+from pants.engine.platform import Platform
+from pants.engine.process import Process, ProcessCacheScope, ProcessResult
+from pants.engine.rules import Get, collect_rules, goal_rule, rule
+from pants.engine.target import AllTargets
+from pants.engine.unions import UnionMembership
+from pants.option.option_types import StrListOption, StrOption
+from pants.util.logging import LogLevel
+from pants.util.strutil import softwrap
+
+from pants_cargo_porcelain.internal.platform import platform_to_target
+from pants_cargo_porcelain.subsystems import RustupTool
+from pants_cargo_porcelain.target_types import CargoTargetTriplesField
+from pants_cargo_porcelain.util_rules.rustup import RustToolchainComponents
+
+logger = logging.getLogger(__name__)
+
+_MINIMAL_COMPONENTS = ("rustc", "rust-std", "cargo")
+
+_DOWNLOAD_SCRIPT_PATH = "__rustup_mirror_download.py"
+_DOWNLOAD_SCRIPT = """\
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+with open(sys.argv[1]) as f:
+    plan = json.load(f)
+
+for entry in plan:
+    dest = os.path.join("mirror", entry["path"])
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    sha256 = hashlib.sha256()
+    with urllib.request.urlopen(entry["url"]) as response, open(dest, "wb") as f:
+        for chunk in iter(lambda: response.read(1 << 20), b""):
+            sha256.update(chunk)
+            f.write(chunk)
+
+    if entry["sha256"] and sha256.hexdigest() != entry["sha256"]:
+        sys.exit(f"Checksum mismatch for {entry['url']}: got {sha256.hexdigest()}")
+"""
+
+
+class RustupMirrorSubsystem(GoalSubsystem):
+    name = "rustup-mirror"
+    help = softwrap("""
+        Populate a local mirror of the Rust dist server, for use with `[rustup].dist_server` on
+        machines without internet access.
+        """)
+
+    toolchains = StrListOption(
+        default=[],
+        help=softwrap("""
+            The toolchain versions to mirror. Defaults to `[rustup].rust_version`.
+            """),
+    )
+
+    targets = StrListOption(
+        default=[],
+        help=softwrap("""
+            The target triples to mirror toolchains with host tools for. Defaults to the triple of
+            the current platform.
+            """),
+    )
+
+    cross_targets = StrListOption(
+        default=[],
+        help=softwrap("""
+            Additional target triples to mirror only the standard library for, such as
+            `wasm32-unknown-unknown`, which often has no host tools. The `target_triples` of all
+            targets in the repository are included automatically.
+            """),
+    )
+
+    upstream = StrOption(
+        default="https://static.rust-lang.org",
+        help="The dist server to copy from.",
+        advanced=True,
+    )
+
+    output_dir = StrOption(
+        default="dist/rust-mirror",
+        help="Where to write the mirror, relative to the build root.",
+    )
+
+
+class RustupMirror(Goal):
+    subsystem_cls = RustupMirrorSubsystem
+    environment_behavior = Goal.EnvironmentBehavior.LOCAL_ONLY
+
+
+@dataclass(frozen=True)
+class MirrorEntry:
+    url: str
+    path: str
+    sha256: str | None = None
+
+
+@dataclass(frozen=True)
+class MirrorDownloadRequest:
+    entries: tuple[MirrorEntry, ...]
+    description: str
+    cache_scope: ProcessCacheScope = ProcessCacheScope.SUCCESSFUL
+
+
+@dataclass(frozen=True)
+class MirrorDownload:
+    digest: Digest
+
+
+@rule(desc="Download files for rustup mirror", level=LogLevel.DEBUG)
+async def download_mirror_entries(
+    request: MirrorDownloadRequest, python: PythonBuildStandaloneBinary
+) -> MirrorDownload:
+    plan = json.dumps([
+        {"url": entry.url, "path": entry.path, "sha256": entry.sha256} for entry in request.entries
+    ])
+    input_digest = await Get(
+        Digest,
+        CreateDigest([
+            FileContent(_DOWNLOAD_SCRIPT_PATH, _DOWNLOAD_SCRIPT.encode()),
+            FileContent("plan.json", plan.encode()),
+        ]),
+    )
+
+    process_result = await Get(
+        ProcessResult,
+        Process(
+            argv=(python.path, _DOWNLOAD_SCRIPT_PATH, "plan.json"),
+            input_digest=input_digest,
+            description=request.description,
+            level=LogLevel.DEBUG,
+            append_only_caches=python.APPEND_ONLY_CACHES,
+            immutable_input_digests=python.immutable_input_digests,
+            output_directories=("mirror",),
+            cache_scope=request.cache_scope,
+        ),
+    )
+
+    digest = await Get(Digest, RemovePrefix(process_result.output_digest, "mirror"))
+    return MirrorDownload(digest)
+
+
+def select_mirror_entries(
+    channel: dict,
+    upstream: str,
+    target: str,
+    components: tuple[str, ...],
+) -> list[MirrorEntry]:
+    """Select the packages rustup needs from a channel manifest to install `components`."""
+    renames = channel.get("renames", {})
+    entries = []
+    for component in components:
+        package_name = renames.get(component, {}).get("to", component)
+        package_targets = channel["pkg"][package_name]["target"]
+        package = package_targets.get(target) or package_targets.get("*")
+        if not package or not package.get("available"):
+            raise ValueError(
+                f"The component {component!r} is not available for {target} in the channel"
+                f" manifest dated {channel['date']}."
+            )
+
+        url = package["xz_url"]
+        if not url.startswith(upstream):
+            raise ValueError(f"The package URL {url} is not served from {upstream}.")
+
+        entries.append(MirrorEntry(url, url.removeprefix(f"{upstream}/"), package["xz_hash"]))
+
+    return entries
+
+
+def select_cross_target_entries(
+    channel: dict, upstream: str, version: str, target: str, hermetic: bool
+) -> list[MirrorEntry]:
+    """Select the packages needed to cross-compile for `target`, which may have no host tools."""
+    (std,) = select_mirror_entries(channel, upstream, target, ("rust-std",))
+    entries = [std]
+    if hermetic:
+        path = f"dist/rust-std-{version}-{target}.tar.xz"
+        entries.append(MirrorEntry(std.url, path, std.sha256))
+    return entries
+
+
+@goal_rule
+async def rustup_mirror(
+    subsystem: RustupMirrorSubsystem,
+    rustup: RustupTool,
+    workspace: Workspace,
+    platform: Platform,
+    union_membership: UnionMembership,
+    all_targets: AllTargets,
+) -> RustupMirror:
+    upstream = subsystem.upstream.rstrip("/")
+    versions = tuple(subsystem.toolchains) or (rustup.rust_version,)
+    targets = tuple(subsystem.targets) or (platform_to_target(platform),)
+    cross_targets = set(subsystem.cross_targets)
+    for target in all_targets:
+        if target.has_field(CargoTargetTriplesField):
+            cross_targets.update(target[CargoTargetTriplesField].value or ())
+    cross_targets.difference_update(targets)
+
+    components = set(_MINIMAL_COMPONENTS)
+    for member in union_membership.get(RustToolchainComponents):
+        components.update(member.components)
+
+    manifest_entries = []
+    for version in versions:
+        for suffix in ("toml", "toml.sha256"):
+            path = f"dist/channel-rust-{version}.{suffix}"
+            manifest_entries.append(MirrorEntry(f"{upstream}/{path}", path))
+
+    manifests = await Get(
+        MirrorDownload,
+        MirrorDownloadRequest(
+            tuple(manifest_entries),
+            description=f"Downloading channel manifests for Rust {', '.join(versions)}",
+            cache_scope=ProcessCacheScope.PER_SESSION,
+        ),
+    )
+    manifest_contents = await Get(DigestContents, Digest, manifests.digest)
+    channels = {
+        file_content.path: toml.loads(file_content.content.decode())
+        for file_content in manifest_contents
+        if file_content.path.endswith(".toml")
+    }
+
+    package_entries = []
+    for version in versions:
+        channel = channels[f"dist/channel-rust-{version}.toml"]
+        for target in targets:
+            package_entries.extend(
+                select_mirror_entries(channel, upstream, target, tuple(sorted(components)))
+            )
+
+            if rustup.hermetic_toolchains:
+                (archive,) = select_mirror_entries(channel, upstream, target, ("rust",))
+                path = f"dist/rust-{version}-{target}.tar.xz"
+                package_entries.append(MirrorEntry(archive.url, path, archive.sha256))
+
+        for target in sorted(cross_targets):
+            package_entries.extend(
+                select_cross_target_entries(
+                    channel, upstream, version, target, rustup.hermetic_toolchains
+                )
+            )
+
+    rustup_hosts = {platform_to_target(plat) for plat in Platform}
+    for target in sorted(rustup_hosts.intersection(targets)):
+        path = f"rustup/archive/{rustup.version[1:]}/{target}/rustup-init"
+        package_entries.append(MirrorEntry(f"{upstream}/{path}", path))
+
+    packages = await Get(
+        MirrorDownload,
+        MirrorDownloadRequest(
+            tuple(package_entries),
+            description=f"Downloading {len(package_entries)} files for the Rust mirror",
+        ),
+    )
+
+    digest = await Get(Digest, MergeDigests([manifests.digest, packages.digest]))
+    workspace.write_digest(digest, path_prefix=subsystem.output_dir)
+    logger.info(f"Wrote Rust mirror for {', '.join(versions)} to {subsystem.output_dir}")
+
+    return RustupMirror(exit_code=0)
+
+
+def rules():
+    return [
+        *collect_rules(),
+    ]
@@ -0,0 +1,92 @@
+import pytest
+
+from pants_cargo_porcelain.goals.rustup_mirror import (
+    MirrorEntry,
+    select_cross_target_entries,
+    select_mirror_entries,
+)
+
+UPSTREAM = "https://static.rust-lang.org"
+
+CHANNEL = {
+    "date": "2023-09-19",
+    "renames": {"rustfmt": {"to": "rustfmt-preview"}},
+    "pkg": {
+        "rustc": {
+            "target": {
+                "x86_64-unknown-linux-gnu": {
+                    "available": True,
+                    "xz_url": (
+                        f"{UPSTREAM}/dist/2023-09-19/rustc-1.72.1-x86_64-unknown-linux-gnu.tar.xz"
+                    ),
+                    "xz_hash": "aaaa",
+                },
+            },
+        },
+        "rust-std": {
+            "target": {
+                "wasm32-unknown-unknown": {
+                    "available": True,
+                    "xz_url": (
+                        f"{UPSTREAM}/dist/2023-09-19/rust-std-1.72.1-wasm32-unknown-unknown.tar.xz"
+                    ),
+                    "xz_hash": "cccc",
+                },
+            },
+        },
+        "rustfmt-preview": {
+            "target": {
+                "x86_64-unknown-linux-gnu": {
+                    "available": True,
+                    "xz_url": (
+                        f"{UPSTREAM}/dist/2023-09-19/rustfmt-1.72.1-x86_64-unknown-linux-gnu.tar.xz"
+                    ),
+                    "xz_hash": "bbbb",
+                },
+                "aarch64-unknown-linux-gnu": {"available": False},
+            },
+        },
+    },
+}
+
+
+def test_select_mirror_entries_follows_renames() -> None:
+    entries = select_mirror_entries(
+        CHANNEL, UPSTREAM, "x86_64-unknown-linux-gnu", ("rustc", "rustfmt")
+    )
+
+    assert entries == [
+        MirrorEntry(
+            f"{UPSTREAM}/dist/2023-09-19/rustc-1.72.1-x86_64-unknown-linux-gnu.tar.xz",
+            "dist/2023-09-19/rustc-1.72.1-x86_64-unknown-linux-gnu.tar.xz",
+            "aaaa",
+        ),
+        MirrorEntry(
+            f"{UPSTREAM}/dist/2023-09-19/rustfmt-1.72.1-x86_64-unknown-linux-gnu.tar.xz",
+            "dist/2023-09-19/rustfmt-1.72.1-x86_64-unknown-linux-gnu.tar.xz",
+            "bbbb",
+        ),
+    ]
+
+
+def test_select_mirror_entries_unavailable() -> None:
+    with pytest.raises(ValueError, match="not available"):
+        select_mirror_entries(CHANNEL, UPSTREAM, "aarch64-unknown-linux-gnu", ("rustfmt",))
+
+
+@pytest.mark.parametrize("hermetic", [False, True])
+def test_select_cross_target_entries_only_mirrors_std(hermetic: bool) -> None:
+    # The channel has no rustc, cargo or rustfmt for wasm32.
+    entries = select_cross_target_entries(
+        CHANNEL, UPSTREAM, "1.72.1", "wasm32-unknown-unknown", hermetic
+    )
+
+    url = f"{UPSTREAM}/dist/2023-09-19/rust-std-1.72.1-wasm32-unknown-unknown.tar.xz"
+    expected = [
+        MirrorEntry(url, "dist/2023-09-19/rust-std-1.72.1-wasm32-unknown-unknown.tar.xz", "cccc")
+    ]
+    if hermetic:
+        expected.append(
+            MirrorEntry(url, "dist/rust-std-1.72.1-wasm32-unknown-unknown.tar.xz", "cccc")
+        )
+    assert entries == expected
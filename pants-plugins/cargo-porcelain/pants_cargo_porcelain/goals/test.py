@@ -1,29 +1,62 @@
 from __future__ import annotations
 
+import json
+import os
 from dataclasses import dataclass
+from typing import Mapping, Sequence
 
-from pants.core.goals.test import ShowOutput, TestRequest, TestResult
+from pants.base.specs import DirLiteralSpec, RawSpecs
+from pants.core.goals.test import ShowOutput, TestRequest, TestResult, TestSubsystem
 from pants.core.util_rules.environments import EnvironmentField
 from pants.core.util_rules.source_files import SourceFiles
 from pants.engine.addresses import Address
+from pants.engine.fs import (
+    AddPrefix,
+    CreateDigest,
+    Digest,
+    DigestEntries,
+    Directory,
+    FileContent,
+    FileEntry,
+    MergeDigests,
+    Snapshot,
+)
 from pants.engine.internals.selectors import Get, MultiGet
-from pants.engine.platform import Platform
-from pants.engine.process import FallibleProcessResult
+from pants.engine.process import (
+    FallibleProcessResult,
+    Process,
+    ProcessCacheScope,
+    ProcessResult,
+    ProcessResultWithRetries,
+    ProcessWithRetries,
+)
 from pants.engine.rules import collect_rules, rule
-from pants.engine.target import FieldSet
+from pants.engine.target import FieldSet, Targets
+from pants.util.frozendict import FrozenDict
 from pants.util.logging import LogLevel
 
-from pants_cargo_porcelain.internal.platform import platform_to_target
-from pants_cargo_porcelain.subsystems import RustSubsystem, RustupTool
+from pants_cargo_porcelain.subsystems import RustSubsystem
 from pants_cargo_porcelain.target_types import (
+    CargoAllFeaturesField,
     CargoBinaryNameField,
+    CargoDefaultFeaturesField,
+    CargoFeaturesField,
     CargoLibraryNameField,
     CargoPackageSourcesField,
     CargoTestNameField,
+    CargoTestShardCountField,
 )
+from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest
+from pants_cargo_porcelain.tools.nextest import CargoNextest
 from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
-from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
+from pants_cargo_porcelain.util_rules.rustup import CargoToolchainRequest, RustToolchain
 from pants_cargo_porcelain.util_rules.sandbox import CargoSourcesRequest
+from pants_cargo_porcelain.util_rules.workspace import (
+    CargoPackageMapping,
+    CargoTargetCachePath,
+    CargoTargetCachePathRequest,
+)
 
 
 @dataclass(frozen=True)
@@ -33,6 +66,11 @@ class CargoTestFieldSet(FieldSet):
     library_name: CargoLibraryNameField
     binary_name: CargoBinaryNameField
     test_name: CargoTestNameField
+    shard_count: CargoTestShardCountField
+
+    features: CargoFeaturesField
+    default_features: CargoDefaultFeaturesField
+    all_features: CargoAllFeaturesField
 
     sources: CargoPackageSourcesField
     environment: EnvironmentField
@@ -53,67 +91,534 @@ class PackageMetadata:
         return None
 
 
-@rule(desc="Test Cargo package", level=LogLevel.DEBUG)
-async def cargo_test(
-    request: CargoTestRequest.Batch[CargoTestFieldSet, PackageMetadata],
-    rustup: RustupTool,
-    platform: Platform,
-) -> TestResult:
-    toolchain, source_files = await MultiGet(
+@dataclass(frozen=True)
+class CargoTestBinariesRequest:
+    """Build the test binaries of several targets of a package with a single cargo invocation."""
+
+    address: Address
+    features: CargoFeatures
+    # The cargo arguments that select each test target, such as `--lib` or `--test=foo`.
+    test_targets: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class CargoTestBinaries:
+    # The result of the build, which is reported for every test target if it failed.
+    process_result: FallibleProcessResult
+    # The test binaries, under `_TEST_BINARIES_DIR`.
+    digest: Digest
+    # The file name of the test binary of each test target, as passed to cargo.
+    executables: FrozenDict[str, str]
+    # The file name of each binary of the package, by binary name.
+    bin_executables: FrozenDict[str, str]
+
+
+_TEST_BINARIES_DIR = ".cargo-test-binaries"
+
+
+def parse_test_executables(stdout: str) -> dict[str, str]:
+    """Map the test targets in cargo's JSON messages to the file names of their test binaries."""
+    executables = {}
+    for line in stdout.splitlines():
+        if not line.startswith("{"):
+            continue
+        message = json.loads(line)
+        if (
+            message.get("reason") != "compiler-artifact"
+            or not message.get("executable")
+            or not message["profile"]["test"]
+        ):
+            continue
+
+        target = message["target"]
+        kinds = set(target["kind"])
+        if kinds & {"lib", "rlib", "dylib", "cdylib", "staticlib", "proc-macro"}:
+            test_target = "--lib"
+        elif "bin" in kinds:
+            test_target = f"--bin={target['name']}"
+        elif "test" in kinds:
+            test_target = f"--test={target['name']}"
+        else:
+            continue
+        executables[test_target] = os.path.basename(message["executable"])
+    return executables
+
+
+def parse_test_names(stdout: str) -> list[str]:
+    """The names of the tests in the output of a test binary run with `--list --format=terse`."""
+    return [line[: -len(": test")] for line in stdout.splitlines() if line.endswith(": test")]
+
+
+def shard_tests(test_names: Sequence[str], shard_count: int) -> list[tuple[str, ...]]:
+    """Spread tests over at most `shard_count` shards, round-robin, so that shards stay balanced
+    even when related, similarly expensive tests are listed next to each other."""
+    test_names = sorted(test_names)
+    return [tuple(test_names[i::shard_count]) for i in range(min(shard_count, len(test_names)))]
+
+
+@dataclass(frozen=True)
+class CargoTestShardsRequest:
+    results: tuple[FallibleProcessResult, ...]
+
+
+@dataclass(frozen=True)
+class CargoTestShards:
+    """The results of the shards of a test binary, merged into one result."""
+
+    result: FallibleProcessResult
+
+
+@rule(desc="Merge cargo test shard results", level=LogLevel.DEBUG)
+async def merge_cargo_test_shards(request: CargoTestShardsRequest) -> CargoTestShards:
+    """Merge the results of the shards of a test binary into one result, which fails if any shard
+    failed.
+
+    The output of all shards is concatenated and stored, so that the digests of the merged output
+    resolve. Everything else is taken from the first failing shard, or the last one if all passed.
+    """
+    failed = [result for result in request.results if result.exit_code != 0]
+    source = failed[0] if failed else request.results[-1]
+    stdout = b"".join(result.stdout for result in request.results)
+    stderr = b"".join(result.stderr for result in request.results)
+    output = await Get(
+        Digest, CreateDigest([FileContent("stdout", stdout), FileContent("stderr", stderr)])
+    )
+    entries = await Get(DigestEntries, Digest, output)
+    file_digests = {
+        entry.path: entry.file_digest for entry in entries if isinstance(entry, FileEntry)
+    }
+    return CargoTestShards(
+        FallibleProcessResult(
+            stdout=stdout,
+            stdout_digest=file_digests["stdout"],
+            stderr=stderr,
+            stderr_digest=file_digests["stderr"],
+            exit_code=source.exit_code,
+            output_digest=source.output_digest,
+            metadata=source.metadata,
+        )
+    )
+
+
+def parse_bin_executables(stdout: str) -> dict[str, str]:
+    """Map the names of the binaries in cargo's JSON messages to the file names of their builds."""
+    executables = {}
+    for line in stdout.splitlines():
+        if not line.startswith("{"):
+            continue
+        message = json.loads(line)
+        if (
+            message.get("reason") == "compiler-artifact"
+            and message.get("executable")
+            and not message["profile"]["test"]
+            and "bin" in message["target"]["kind"]
+        ):
+            executables[message["target"]["name"]] = os.path.basename(message["executable"])
+    return executables
+
+
+def cargo_test_env(spec_path: str, bin_executables: Mapping[str, str]) -> dict[str, str]:
+    """The environment `cargo test` runs test binaries with, pointing into the sandbox.
+
+    Paths that cargo passes at compile time, such as `env!("CARGO_BIN_EXE_<name>")`, are compiled
+    into the test binaries and keep pointing into the target directory.
+    """
+    binaries_dir = f"{{chroot}}/{_TEST_BINARIES_DIR}"
+    return {
+        "CARGO_MANIFEST_DIR": os.path.join("{chroot}", spec_path),
+        **{
+            f"CARGO_BIN_EXE_{name}": f"{binaries_dir}/{executable}"
+            for name, executable in bin_executables.items()
+        },
+        # The dynamic libraries of the package are collected next to the binaries.
+        "LD_LIBRARY_PATH": binaries_dir,
+        "DYLD_FALLBACK_LIBRARY_PATH": binaries_dir,
+    }
+
+
+def cargo_test_target(field_set: CargoTestFieldSet) -> str | None:
+    """The cargo argument that selects the tests of `field_set`, if it has any."""
+    if field_set.library_name.value:
+        return "--lib"
+    if field_set.test_name.value:
+        return f"--test={field_set.test_name.value}"
+    if field_set.binary_name.value:
+        return f"--bin={field_set.binary_name.value}"
+    return None
+
+
+@rule(desc="Build Cargo test binaries", level=LogLevel.DEBUG)
+async def build_cargo_test_binaries(request: CargoTestBinariesRequest) -> CargoTestBinaries:
+    # Tests share the target directory of dev builds, which already holds their dependencies.
+    toolchain, source_files, cache_path = await MultiGet(
+        Get(RustToolchain, CargoToolchainRequest(request.address)),
+        Get(SourceFiles, CargoSourcesRequest(frozenset([request.address]))),
         Get(
-            RustToolchain,
-            RustToolchainRequest(
-                rustup.rust_version, platform_to_target(platform), ("cargo", "rustfmt")
+            CargoTargetCachePath,
+            CargoTargetCachePathRequest(request.address, profile="test", features=request.features),
+        ),
+    )
+
+    process_result = await Get(
+        FallibleProcessResult,
+        CargoProcessRequest(
+            toolchain,
+            (
+                "test",
+                f"--manifest-path={request.address.spec_path}/Cargo.toml",
+                *request.features.args,
+                "--no-run",
+                "--message-format=json-render-diagnostics",
+                *request.test_targets,
             ),
+            source_files.snapshot.digest,
+            output_directories=(_TEST_BINARIES_DIR,),
+            executables_dir=_TEST_BINARIES_DIR,
+            cache_path=cache_path.path,
+            compiler_cache=True,
+            description=f"Build cargo test binaries of {request.address}",
         ),
-        Get(SourceFiles, CargoSourcesRequest(frozenset([request.elements[0].address]))),
     )
 
-    cargo_toml_path = f"{request.elements[0].address.spec_path}/Cargo.toml"
+    stdout = process_result.stdout.decode()
+    return CargoTestBinaries(
+        process_result,
+        process_result.output_digest,
+        FrozenDict(parse_test_executables(stdout)),
+        FrozenDict(parse_bin_executables(stdout)),
+    )
 
-    if request.elements[0].library_name.value:
-        process_result = await Get(
-            FallibleProcessResult,
-            CargoProcessRequest(
-                toolchain,
-                ("test", f"--manifest-path={cargo_toml_path}", "--lib"),
-                source_files.snapshot.digest,
+
+@dataclass(frozen=True)
+class CargoNextestArchiveRequest:
+    address: Address
+    features: CargoFeatures
+
+
+@dataclass(frozen=True)
+class CargoNextestArchive:
+    # The result of the build, which is reported for every test target if it failed.
+    process_result: FallibleProcessResult
+    # The archive, as `_NEXTEST_ARCHIVE`.
+    digest: Digest
+
+
+@dataclass(frozen=True)
+class CargoNextestRunRequest:
+    address: Address
+    features: CargoFeatures
+    # The cargo argument that selects the tests to run, such as `--lib` or `--test=foo`.
+    test_target: str
+    shard_count: int = 1
+
+
+_NEXTEST_ARCHIVE = ".cargo-nextest-archive.tar.zst"
+_NEXTEST_EXTRACT_DIR = ".cargo-nextest-extract"
+_NEXTEST_CONFIG = ".cargo-nextest.toml"
+# Tool configuration, which the configuration of the repository takes precedence over.
+_NEXTEST_CONFIG_CONTENT = b"""\
+[profile.default.junit]
+path = "junit.xml"
+"""
+# Relative to the workspace, as `nextest` keeps its store in the `target` directory of the
+# workspace that an archive is run in.
+_NEXTEST_JUNIT = "target/nextest/default/junit.xml"
+
+
+def nextest_filterset(test_target: str) -> str:
+    """The `nextest` filterset that selects the tests of a cargo test target, e.g. `--lib`."""
+    if test_target == "--lib":
+        return "kind(lib)"
+    kind, _, name = test_target[2:].partition("=")
+    return f"kind({kind}) & binary(={name})"
+
+
+def nextest_run_argv(
+    exe: str,
+    workspace_root: str,
+    test_target: str,
+    retries: int,
+    partition: str | None = None,
+) -> tuple[str, ...]:
+    """The arguments to run the tests of a cargo test target from the archive of its package."""
+    return (
+        exe,
+        "nextest",
+        "run",
+        f"--archive-file={_NEXTEST_ARCHIVE}",
+        # The archive records the absolute path of the workspace it was built in.
+        "--workspace-remap=" + os.path.join("{chroot}", workspace_root),
+        f"--extract-to={_NEXTEST_EXTRACT_DIR}",
+        # Tool configuration files have to be given by absolute path.
+        f"--tool-config-file=pants:{{chroot}}/{_NEXTEST_CONFIG}",
+        f"--retries={retries}",
+        "--no-fail-fast",
+        "--no-tests=pass",
+        "-E",
+        nextest_filterset(test_target),
+        *([f"--partition={partition}"] if partition else []),
+    )
+
+
+@rule(desc="Build cargo nextest archive", level=LogLevel.DEBUG)
+async def build_cargo_nextest_archive(
+    request: CargoNextestArchiveRequest, nextest: CargoNextest
+) -> CargoNextestArchive:
+    toolchain, source_files, cache_path, nextest_tool = await MultiGet(
+        Get(RustToolchain, CargoToolchainRequest(request.address)),
+        Get(SourceFiles, CargoSourcesRequest(frozenset([request.address]))),
+        Get(
+            CargoTargetCachePath,
+            CargoTargetCachePathRequest(request.address, profile="test", features=request.features),
+        ),
+        Get(InstalledRustTool, RustToolRequest, nextest.as_tool_request()),
+    )
+
+    process_result = await Get(
+        FallibleProcessResult,
+        CargoProcessRequest(
+            toolchain,
+            (
+                "nextest",
+                "archive",
+                f"--manifest-path={request.address.spec_path}/Cargo.toml",
+                *request.features.args,
+                f"--archive-file={_NEXTEST_ARCHIVE}",
             ),
+            source_files.snapshot.digest,
+            output_files=(_NEXTEST_ARCHIVE,),
+            cache_path=cache_path.path,
+            compiler_cache=True,
+            description=f"Build cargo nextest archive of {request.address}",
+            immutable_input_digests=FrozenDict({".cargo-nextest": nextest_tool.digest}),
+        ),
+    )
+
+    return CargoNextestArchive(process_result, process_result.output_digest)
+
+
+@rule(desc="Run cargo nextest", level=LogLevel.DEBUG)
+async def run_cargo_nextest(
+    request: CargoNextestRunRequest,
+    nextest: CargoNextest,
+    test_subsystem: TestSubsystem,
+    package_mapping: CargoPackageMapping,
+) -> TestResult:
+    """Run the tests of a target from the `nextest` archive of its package.
+
+    The archive holds the test binaries of the whole package, so it is built once for all its test
+    targets. Running from it needs neither cargo nor the target directory.
+    """
+    package_address = request.address.maybe_convert_to_target_generator()
+    archive, source_files, nextest_tool, config_digest = await MultiGet(
+        Get(CargoNextestArchive, CargoNextestArchiveRequest(package_address, request.features)),
+        Get(SourceFiles, CargoSourcesRequest(frozenset([package_address]))),
+        Get(InstalledRustTool, RustToolRequest, nextest.as_tool_request()),
+        Get(
+            Digest,
+            CreateDigest([
+                FileContent(_NEXTEST_CONFIG, _NEXTEST_CONFIG_CONTENT),
+                # `nextest` only extracts into an existing directory.
+                Directory(_NEXTEST_EXTRACT_DIR),
+            ]),
+        ),
+    )
+    if archive.process_result.exit_code != 0:
+        return TestResult.from_fallible_process_result(
+            (archive.process_result,), request.address, ShowOutput.FAILED
         )
 
-    elif request.elements[0].test_name.value:
-        process_result = await Get(
+    input_digest = await Get(
+        Digest, MergeDigests([source_files.snapshot.digest, archive.digest, config_digest])
+    )
+    workspace_root = (
+        package_mapping.workspace_for_address(package_address) or package_address
+    ).spec_path
+    junit_path = os.path.join(workspace_root, _NEXTEST_JUNIT)
+
+    partitions: list[str | None] = [None]
+    if request.shard_count > 1:
+        partitions = [f"count:{i}/{request.shard_count}" for i in range(1, request.shard_count + 1)]
+
+    results = await MultiGet(
+        Get(
             FallibleProcessResult,
-            CargoProcessRequest(
-                toolchain,
-                (
-                    "test",
-                    f"--manifest-path={cargo_toml_path}",
-                    f"--test={request.elements[0].test_name.value}",
+            Process(
+                argv=nextest_run_argv(
+                    f"{{chroot}}/.cargo-nextest/{nextest_tool.exe}",
+                    workspace_root,
+                    request.test_target,
+                    test_subsystem.attempts_default - 1,
+                    partition,
+                ),
+                input_digest=input_digest,
+                immutable_input_digests={".cargo-nextest": nextest_tool.digest},
+                output_files=(junit_path,),
+                description=(
+                    f"Run cargo nextest of {request.address}"
+                    + (f" (partition {partition})" if partition else "")
+                ),
+                level=LogLevel.DEBUG,
+                cache_scope=(
+                    ProcessCacheScope.PER_SESSION
+                    if test_subsystem.force
+                    else ProcessCacheScope.SUCCESSFUL
                 ),
-                source_files.snapshot.digest,
             ),
         )
+        for partition in partitions
+    )
+
+    if len(results) == 1:
+        process_result = results[0]
+        junit_digest = process_result.output_digest
+    else:
+        # Every partition writes its JUnit report to the same path.
+        junit_digests = await MultiGet(
+            Get(Digest, AddPrefix(result.output_digest, f"partition-{i}"))
+            for i, result in enumerate(results, start=1)
+        )
+        shards, junit_digest = await MultiGet(
+            Get(CargoTestShards, CargoTestShardsRequest(tuple(results))),
+            Get(Digest, MergeDigests(junit_digests)),
+        )
+        process_result = shards.result
 
-    elif request.elements[0].binary_name.value:
-        process_result = await Get(
-            FallibleProcessResult,
-            CargoProcessRequest(
-                toolchain,
-                (
-                    "test",
-                    f"--manifest-path={cargo_toml_path}",
-                    f"--bin={request.elements[0].binary_name.value}",
-                ),
-                source_files.snapshot.digest,
+    junit_snapshot = await Get(Snapshot, Digest, junit_digest)
+    return TestResult.from_fallible_process_result(
+        (process_result,),
+        request.address,
+        ShowOutput.FAILED,
+        xml_results=junit_snapshot if junit_snapshot.files else None,
+    )
+
+
+@rule(desc="Test Cargo target", level=LogLevel.DEBUG)
+async def cargo_test(
+    request: CargoTestRequest.Batch[CargoTestFieldSet, PackageMetadata],
+    test_subsystem: TestSubsystem,
+    nextest: CargoNextest,
+) -> TestResult:
+    """Run the test binary of a target.
+
+    Every test target of a package resolves to the same `CargoTestBinariesRequest`, so that the
+    test binaries of the package are built by one cargo process. Each binary is then run by a
+    process of its own, which is cached and retried independently of the build. It needs neither
+    the toolchain nor the target directory, except for paths compiled into the tests, see
+    `cargo_test_env`.
+    """
+    field_set = request.elements[0]
+    test_target = cargo_test_target(field_set)
+    if test_target is None:
+        return TestResult.no_tests_found(field_set.address, ShowOutput.FAILED)
+
+    features = CargoFeatures.from_fields(
+        field_set.features, field_set.default_features, field_set.all_features
+    )
+    if nextest.enabled:
+        return await Get(
+            TestResult,
+            CargoNextestRunRequest(
+                field_set.address, features, test_target, field_set.shard_count.value
             ),
         )
 
-    else:
-        return TestResult.no_tests_found(request.elements[0].address, ShowOutput.FAILED)
+    package_address = field_set.address.maybe_convert_to_target_generator()
+    siblings = await Get(
+        Targets,
+        RawSpecs(
+            dir_literals=(DirLiteralSpec(field_set.address.spec_path),),
+            description_of_origin="Batching cargo tests",
+        ),
+    )
+    test_targets = {test_target}
+    for target in siblings:
+        if (
+            not CargoTestFieldSet.is_applicable(target)
+            or target.address.maybe_convert_to_target_generator() != package_address
+            or CargoFeatures.from_target(target) != features
+        ):
+            continue
+
+        sibling_test_target = cargo_test_target(CargoTestFieldSet.create(target))
+        if sibling_test_target:
+            test_targets.add(sibling_test_target)
+
+    binaries, source_files = await MultiGet(
+        Get(
+            CargoTestBinaries,
+            CargoTestBinariesRequest(package_address, features, tuple(sorted(test_targets))),
+        ),
+        Get(SourceFiles, CargoSourcesRequest(frozenset([package_address]))),
+    )
+    if binaries.process_result.exit_code != 0:
+        return TestResult.from_fallible_process_result(
+            (binaries.process_result,), field_set.address, ShowOutput.FAILED
+        )
+
+    executable = binaries.executables.get(test_target)
+    if executable is None:
+        return TestResult.no_tests_found(field_set.address, ShowOutput.FAILED)
+
+    input_digest = await Get(Digest, MergeDigests([source_files.snapshot.digest, binaries.digest]))
+    spec_path = field_set.address.spec_path
+
+    def test_process(args: tuple[str, ...], description: str) -> Process:
+        return Process(
+            # Cargo runs tests from the package directory.
+            argv=(f"{{chroot}}/{_TEST_BINARIES_DIR}/{executable}", *args),
+            input_digest=input_digest,
+            working_directory=spec_path or None,
+            env=cargo_test_env(spec_path, binaries.bin_executables),
+            description=description,
+            level=LogLevel.DEBUG,
+            cache_scope=(
+                ProcessCacheScope.PER_SESSION
+                if test_subsystem.force
+                else ProcessCacheScope.SUCCESSFUL
+            ),
+        )
+
+    shards: list[tuple[str, ...]] = [()]
+    if field_set.shard_count.value > 1:
+        listing = await Get(
+            ProcessResult,
+            test_process(("--list", "--format=terse"), f"List cargo tests of {field_set.address}"),
+        )
+        test_names = parse_test_names(listing.stdout.decode())
+        if test_names:
+            shards = [
+                ("--exact", *shard)
+                for shard in shard_tests(test_names, field_set.shard_count.value)
+            ]
 
+    results = await MultiGet(
+        Get(
+            ProcessResultWithRetries,
+            ProcessWithRetries(
+                test_process(
+                    args,
+                    (
+                        f"Run cargo tests of {field_set.address}"
+                        if len(shards) == 1
+                        else f"Run cargo tests of {field_set.address} (shard {i + 1}/{len(shards)})"
+                    ),
+                ),
+                test_subsystem.attempts_default,
+            ),
+        )
+        for i, args in enumerate(shards)
+    )
+    if len(results) == 1:
+        return TestResult.from_fallible_process_result(
+            results[0].results, field_set.address, ShowOutput.FAILED
+        )
+
+    shards = await Get(
+        CargoTestShards, CargoTestShardsRequest(tuple(result.last for result in results))
+    )
     return TestResult.from_fallible_process_result(
-        (process_result,), request.elements[0].address, ShowOutput.FAILED
+        (shards.result,), field_set.address, ShowOutput.FAILED
     )
 
 
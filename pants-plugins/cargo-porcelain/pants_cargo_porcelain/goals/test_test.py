@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from pants_cargo_porcelain.goals.test import (
+    cargo_test_env,
+    nextest_filterset,
+    nextest_run_argv,
+    parse_bin_executables,
+    parse_test_executables,
+    parse_test_names,
+    shard_tests,
+)
+
+
+def _artifact(kind, name, executable, test=True):
+    return json.dumps({
+        "reason": "compiler-artifact",
+        "target": {"kind": [kind], "name": name},
+        "profile": {"test": test},
+        "executable": executable,
+    })
+
+
+def test_parse_test_executables():
+    stdout = "\n".join([
+        _artifact("lib", "foo", "/target/debug/deps/foo-0123"),
+        _artifact("bin", "cli", "/target/debug/deps/cli-4567"),
+        _artifact("test", "integration", "/target/debug/deps/integration-89ab"),
+        # The binary itself is built as well, but has no test harness.
+        _artifact("bin", "cli", "/target/debug/cli", test=False),
+        _artifact("lib", "dep", None, test=False),
+        json.dumps({"reason": "build-finished", "success": True}),
+    ])
+
+    assert parse_test_executables(stdout) == {
+        "--lib": "foo-0123",
+        "--bin=cli": "cli-4567",
+        "--test=integration": "integration-89ab",
+    }
+
+
+def test_parse_test_names():
+    stdout = "tests::a: test\ntests::b: test\nbenches::c: bench\n"
+    assert parse_test_names(stdout) == ["tests::a", "tests::b"]
+
+
+def test_shard_tests():
+    assert shard_tests(["e", "d", "c", "b", "a"], 2) == [("a", "c", "e"), ("b", "d")]
+    assert shard_tests(["a", "b"], 4) == [("a",), ("b",)]
+
+
+@pytest.mark.parametrize(
+    "test_target, expected",
+    [
+        ("--lib", "kind(lib)"),
+        ("--bin=cli", "kind(bin) & binary(=cli)"),
+        ("--test=integration", "kind(test) & binary(=integration)"),
+    ],
+)
+def test_nextest_filterset(test_target, expected):
+    assert nextest_filterset(test_target) == expected
+
+
+def test_nextest_run_argv():
+    assert nextest_run_argv("nextest", "ws", "--test=integration", 2, "count:1/3") == (
+        "nextest",
+        "nextest",
+        "run",
+        "--archive-file=.cargo-nextest-archive.tar.zst",
+        "--workspace-remap={chroot}/ws",
+        "--extract-to=.cargo-nextest-extract",
+        "--tool-config-file=pants:{chroot}/.cargo-nextest.toml",
+        "--retries=2",
+        "--no-fail-fast",
+        "--no-tests=pass",
+        "-E",
+        "kind(test) & binary(=integration)",
+        "--partition=count:1/3",
+    )
+    # A package at the root of the repository.
+    assert "--workspace-remap={chroot}/" in nextest_run_argv("nextest", "", "--lib", 0)
+
+
+def test_parse_bin_executables():
+    stdout = "\n".join([
+        _artifact("bin", "cli", "/target/debug/deps/cli-4567"),
+        _artifact("bin", "cli", "/target/debug/cli", test=False),
+        _artifact("lib", "dep", None, test=False),
+    ])
+
+    assert parse_bin_executables(stdout) == {"cli": "cli"}
+
+
+def test_cargo_test_env():
+    assert cargo_test_env("pkg", {"cli": "cli"}) == {
+        "CARGO_MANIFEST_DIR": "{chroot}/pkg",
+        "CARGO_BIN_EXE_cli": "{chroot}/.cargo-test-binaries/cli",
+        "LD_LIBRARY_PATH": "{chroot}/.cargo-test-binaries",
+        "DYLD_FALLBACK_LIBRARY_PATH": "{chroot}/.cargo-test-binaries",
+    }
@@ -1,22 +1,53 @@
+from __future__ import annotations
+
+import json
+import logging
 from dataclasses import dataclass
 
+from pants.base.specs import DirLiteralSpec, RawSpecs
 from pants.core.util_rules.source_files import SourceFiles
 from pants.engine.addresses import Address
-from pants.engine.fs import Digest
+from pants.engine.fs import (
+    EMPTY_DIGEST,
+    CreateDigest,
+    Digest,
+    DigestContents,
+    DigestEntries,
+    DigestSubset,
+    FileContent,
+    FileEntry,
+    PathGlobs,
+    RemovePrefix,
+)
 from pants.engine.internals.selectors import Get, MultiGet
-from pants.engine.platform import Platform
 from pants.engine.process import ProcessResult
 from pants.engine.rules import collect_rules, rule
+from pants.engine.target import Targets
 from pants.util.frozendict import FrozenDict
+from pants.util.logging import LogLevel
 
-from pants_cargo_porcelain.internal.platform import platform_to_target
-from pants_cargo_porcelain.subsystems import RustSubsystem, RustupTool
-from pants_cargo_porcelain.target_types import CargoPackageSourcesField
-from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest, Sccache
-from pants_cargo_porcelain.tools.mtime import CargoMtime
-from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
-from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
+from pants_cargo_porcelain.subsystems import RustSubsystem, cargo_profile_dir
+from pants_cargo_porcelain.target_types import (
+    CargoBinaryNameField,
+    CargoPackageSourcesField,
+    CargoProfileField,
+    CargoTargetTriplesField,
+)
+from pants_cargo_porcelain.tool import Sccache, format_sccache_stats
+from pants_cargo_porcelain.util_rules.cargo import (
+    SANDBOX_TARGET_DIR,
+    SCCACHE_STATS_FILE,
+    CargoProcessRequest,
+)
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
+from pants_cargo_porcelain.util_rules.rustup import CargoToolchainRequest, RustToolchain
 from pants_cargo_porcelain.util_rules.sandbox import CargoSourcesRequest
+from pants_cargo_porcelain.util_rules.workspace import (
+    CargoTargetCachePath,
+    CargoTargetCachePathRequest,
+)
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -29,52 +60,252 @@ class CargoBinaryRequest:
     address: Address
     sources: CargoPackageSourcesField
     binary_name: str
+    # Cross-compile for this target triple instead of building for the host.
+    target_triple: str | None = None
+    # Build the binary together with the other binaries of its package, see `[rust].batch_binaries`.
+    batch: bool = True
 
     release_mode: bool = False
 
 
+@dataclass(frozen=True)
+class CargoDependencyLayerRequest:
+    toolchain: RustToolchain
+    manifest_path: str
+    sources: Digest
+    profile: str
+    target_triple: str | None = None
+    features: CargoFeatures = CargoFeatures()
+
+
+@dataclass(frozen=True)
+class CargoDependencyLayer:
+    """A target directory with the third-party dependencies of a package already compiled."""
+
+    digest: Digest
+
+
+# Every Rust source is replaced by a stub that compiles both as a library and as a binary, so that
+# the layer only depends on the manifests, the lockfile and the source layout.
+_RUST_SOURCE_STUB = b"fn main() {}\n"
+
+
+def parse_local_packages(stdout: str) -> set[str]:
+    """The names of the path packages, i.e. those not from a registry or git, that cargo reports
+    artifacts for in its JSON messages."""
+    packages = set()
+    for line in stdout.splitlines():
+        if not line.startswith("{"):
+            continue
+        message = json.loads(line)
+        if message.get("reason") != "compiler-artifact":
+            continue
+
+        package_id = message["package_id"]
+        if package_id.startswith("path+"):
+            # `path+file:///ws/foo#0.1.0`, or `path+file:///ws/foo#bar@0.1.0` when the name
+            # differs from the directory.
+            url, _, fragment = package_id.partition("#")
+            name, at, _ = fragment.rpartition("@")
+            packages.add(name if at else url.rstrip("/").rsplit("/", 1)[-1])
+        elif "(path+" in package_id:
+            # The format before cargo 1.77: `foo 0.1.0 (path+file:///ws/foo)`.
+            packages.add(package_id.split(" ", 1)[0])
+    return packages
+
+
+@rule(desc="Build cargo dependency layer", level=LogLevel.DEBUG)
+async def build_cargo_dependency_layer(req: CargoDependencyLayerRequest) -> CargoDependencyLayer:
+    entries = await Get(DigestEntries, Digest, req.sources)
+    stubbed_sources = await Get(
+        Digest,
+        CreateDigest([
+            (
+                FileContent(entry.path, _RUST_SOURCE_STUB)
+                if isinstance(entry, FileEntry) and entry.path.endswith(".rs")
+                else entry
+            )
+            for entry in entries
+        ]),
+    )
+
+    target_args = [f"--profile={req.profile}"]
+    if req.target_triple:
+        target_args.append(f"--target={req.target_triple}")
+
+    build_result = await Get(
+        ProcessResult,
+        CargoProcessRequest(
+            req.toolchain,
+            (
+                "build",
+                *target_args,
+                *req.features.args,
+                f"--manifest-path={req.manifest_path}",
+                "--locked",
+                "--message-format=json-render-diagnostics",
+            ),
+            stubbed_sources,
+            output_directories=("{cache_path}",),
+            target_dir_digest=EMPTY_DIGEST,
+            compiler_cache=True,
+            description=f"Build dependencies of {req.manifest_path}",
+        ),
+    )
+    digest = await Get(Digest, RemovePrefix(build_result.output_digest, SANDBOX_TARGET_DIR))
+
+    # The path packages were compiled from the stubs. Cargo considers them fresh based on mtimes
+    # alone, which are arbitrary in a sandbox, so their artifacts must not be in the layer.
+    local_packages = sorted(parse_local_packages(build_result.stdout.decode()))
+    if local_packages:
+        clean_result = await Get(
+            ProcessResult,
+            CargoProcessRequest(
+                req.toolchain,
+                (
+                    "clean",
+                    *target_args,
+                    f"--manifest-path={req.manifest_path}",
+                    *(f"--package={package}" for package in local_packages),
+                ),
+                stubbed_sources,
+                output_directories=("{cache_path}",),
+                target_dir_digest=digest,
+                description=f"Remove stubbed packages from dependencies of {req.manifest_path}",
+            ),
+        )
+        digest = await Get(Digest, RemovePrefix(clean_result.output_digest, SANDBOX_TARGET_DIR))
+
+    return CargoDependencyLayer(digest)
+
+
+@dataclass(frozen=True)
+class CargoBinariesRequest:
+    """Build several binaries of a package with a single cargo invocation."""
+
+    address: Address
+    binary_names: tuple[str, ...]
+    # The binary targets, which the sources are collected from.
+    binary_addresses: tuple[Address, ...]
+    profile: str
+    target_triple: str | None = None
+    features: CargoFeatures = CargoFeatures()
+
+
+@dataclass(frozen=True)
+class CargoBinaries:
+    """The built binaries, at the top level of the digest."""
+
+    digest: Digest
+
+
+@rule
+async def build_cargo_binary(req: CargoBinaryRequest, rust: RustSubsystem) -> CargoBinary:
+    """Build a binary, by default together with all other binaries of its package.
+
+    Every binary of a package then resolves to the same `CargoBinariesRequest`, so that the package
+    is built by one cargo process, rather than by one process per binary that all wait on the same
+    target directory. The cost is that building a single binary builds all of them.
+    """
+    package_address = req.address.maybe_convert_to_target_generator()
+    siblings = await Get(
+        Targets,
+        RawSpecs(
+            dir_literals=(DirLiteralSpec(req.address.spec_path),),
+            description_of_origin="Batching cargo binary builds",
+        ),
+    )
+    binaries = {
+        target.address: target
+        for target in siblings
+        if target.has_field(CargoBinaryNameField)
+        and target.address.maybe_convert_to_target_generator() == package_address
+    }
+    # Only binaries that are built with the same profile and features, and for the requested target
+    # triple, can share an invocation. Binaries without target triples are built for the host.
+    configurations = {
+        address: (
+            rust.resolve_profile(target[CargoProfileField].value),
+            CargoFeatures.from_target(target),
+            req.target_triple in (target[CargoTargetTriplesField].value or (None,)),
+        )
+        for address, target in binaries.items()
+    }
+    profile, features, _ = configurations[req.address]
+    addresses = [req.address]
+    if req.batch and rust.batch_binaries:
+        addresses = sorted(
+            address
+            for address, configuration in configurations.items()
+            if configuration == (profile, features, True)
+        )
+
+    built = await Get(
+        CargoBinaries,
+        CargoBinariesRequest(
+            package_address,
+            tuple(binaries[address][CargoBinaryNameField].value for address in addresses),
+            tuple(addresses),
+            profile,
+            req.target_triple,
+            features,
+        ),
+    )
+    digest = await Get(Digest, DigestSubset(built.digest, PathGlobs([req.binary_name])))
+    return CargoBinary(digest)
+
+
 @rule
-async def build_cargo_binary(
-    req: CargoBinaryRequest,
+async def build_cargo_binaries(
+    req: CargoBinariesRequest,
     rust: RustSubsystem,
-    rustup: RustupTool,
     sccache: Sccache,
-    mtime: CargoMtime,
-    platform: Platform,
-) -> CargoBinary:
-    immutable_input_digests = {}
+) -> CargoBinaries:
     env = {}
     extra_args = []
-    append_only_caches = {}
-    source_files, toolchain = await MultiGet(
+    source_files, toolchain, cache_path = await MultiGet(
         Get(
             SourceFiles,
             CargoSourcesRequest(
-                frozenset([req.address]),
+                frozenset(req.binary_addresses),
             ),
         ),
         Get(
             RustToolchain,
-            RustToolchainRequest(
-                rustup.rust_version, platform_to_target(platform), ("cargo", "rustfmt")
-            ),
+            CargoToolchainRequest(req.address, (req.target_triple,) if req.target_triple else ()),
+        ),
+        Get(
+            CargoTargetCachePath,
+            CargoTargetCachePathRequest(req.address, req.profile, req.target_triple, req.features),
         ),
     )
 
-    if sccache.enabled:
-        sccache_tool = await Get(InstalledRustTool, RustToolRequest, sccache.as_tool_request())
+    extra_args.extend((f"--profile={req.profile}", *req.features.args))
+    profile_dir = cargo_profile_dir(req.profile)
+    if req.target_triple:
+        # Cargo puts cross-compiled artifacts in a directory per target triple.
+        extra_args.append(f"--target={req.target_triple}")
+        profile_dir = f"{req.target_triple}/{profile_dir}"
 
-        immutable_input_digests[".sccache"] = sccache_tool.digest
-        env["RUSTC_WRAPPER"] = "{chroot}/.sccache/sccache"
-        env["SCCACHE_LOG"] = "debug"
-        append_only_caches["sccache"] = ".sccache-cache"
-
-    if rust.release:
-        extra_args.append("--release")
+    target_dir_digest = None
+    if rust.dependency_layer:
+        layer = await Get(
+            CargoDependencyLayer,
+            CargoDependencyLayerRequest(
+                toolchain,
+                f"{req.address.spec_path}/Cargo.toml",
+                source_files.snapshot.digest,
+                req.profile,
+                req.target_triple,
+                req.features,
+            ),
+        )
+        target_dir_digest = layer.digest
 
-    build_level = "debug"
-    if rust.release:
-        build_level = "release"
+    output_files = [f"{{cache_path}}/{profile_dir}/{name}" for name in req.binary_names]
+    if sccache.enabled and sccache.report_stats:
+        env["__CARGO_PORCELAIN_SCCACHE_STATS"] = SCCACHE_STATS_FILE
+        output_files.append(SCCACHE_STATS_FILE)
 
     process_result = await Get(
         ProcessResult,
@@ -85,18 +316,27 @@ async def build_cargo_binary(
                 *extra_args,
                 f"--manifest-path={req.address.spec_path}/Cargo.toml",
                 "--locked",
-                f"--bin={req.binary_name}",
+                *(f"--bin={name}" for name in req.binary_names),
             ),
             source_files.snapshot.digest,
-            output_files=(f"{{cache_path}}/{build_level}/{req.binary_name}",),
-            cache_path=req.address.spec_path,
-            immutable_input_digests=FrozenDict(immutable_input_digests),
+            output_files=tuple(output_files),
+            cache_path=cache_path.path,
+            target_dir_digest=target_dir_digest,
+            compiler_cache=True,
             env=FrozenDict(env),
-            append_only_caches=FrozenDict(append_only_caches),
         ),
     )
 
-    return CargoBinary(process_result.output_digest)
+    digest = process_result.output_digest
+    if SCCACHE_STATS_FILE in output_files:
+        stats_contents, digest = await MultiGet(
+            Get(DigestContents, DigestSubset(digest, PathGlobs([SCCACHE_STATS_FILE]))),
+            Get(Digest, DigestSubset(digest, PathGlobs(["**", f"!{SCCACHE_STATS_FILE}"]))),
+        )
+        stats = json.loads(stats_contents[0].content)
+        logger.info(f"sccache for {req.address}: {format_sccache_stats(stats)}")
+
+    return CargoBinaries(digest)
 
 
 def rules():
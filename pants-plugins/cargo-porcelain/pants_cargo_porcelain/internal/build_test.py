@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import subprocess
+
+import pytest
+from pants.build_graph.address import Address
+from pants.core.util_rules import external_tool, source_files
+from pants.engine.fs import DigestContents
+from pants.engine.rules import QueryRule
+from pants.testutil.rule_runner import RuleRunner
+
+from pants_cargo_porcelain import register, subsystems, target_types
+from pants_cargo_porcelain.internal import build
+from pants_cargo_porcelain.internal.build import (
+    CargoBinary,
+    CargoBinaryRequest,
+    parse_local_packages,
+)
+from pants_cargo_porcelain.target_generator import rules as target_generator_rules
+from pants_cargo_porcelain.target_types import CargoPackageSourcesField
+from pants_cargo_porcelain.tool import rules as tool_rules
+from pants_cargo_porcelain.tool_rules import rules as tool_rules_rules
+from pants_cargo_porcelain.tools.mtime import rules as mtime_rules
+from pants_cargo_porcelain.util_rules import cargo, dependency_inference, rustup, workspace
+from pants_cargo_porcelain.util_rules.sandbox import rules as sandbox_rules
+
+
+@pytest.fixture
+def rule_runner() -> RuleRunner:
+    rule_runner = RuleRunner(
+        rules=[
+            *subsystems.rules(),
+            *target_types.rules(),
+            *source_files.rules(),
+            *external_tool.rules(),
+            *cargo.rules(),
+            *rustup.rules(),
+            *workspace.rules(),
+            *dependency_inference.rules(),
+            *sandbox_rules(),
+            *target_generator_rules(),
+            *tool_rules(),
+            *tool_rules_rules(),
+            *mtime_rules(),
+            *build.rules(),
+            QueryRule(CargoBinary, [CargoBinaryRequest]),
+            QueryRule(DigestContents, [CargoBinary]),
+        ],
+        target_types=register.target_types(),
+    )
+    return rule_runner
+
+
+def _artifact(package_id: str) -> str:
+    return json.dumps({"reason": "compiler-artifact", "package_id": package_id})
+
+
+def test_parse_local_packages() -> None:
+    stdout = "\n".join([
+        _artifact("registry+https://github.com/rust-lang/crates.io-index#libc@0.2.150"),
+        _artifact("path+file:///ws/foo#0.1.0"),
+        _artifact("path+file:///ws/crates/bar#bar-impl@0.1.0"),
+        _artifact("baz 0.1.0 (path+file:///ws/baz)"),
+        _artifact("serde 1.0.0 (registry+https://github.com/rust-lang/crates.io-index)"),
+        json.dumps({"reason": "build-finished", "success": True}),
+    ])
+
+    assert parse_local_packages(stdout) == {"foo", "bar-impl", "baz"}
+
+
+def test_dependency_layer_does_not_replace_package_sources(
+    rule_runner: RuleRunner, tmp_path
+) -> None:
+    rule_runner.write_files({
+        "pkg/BUILD": "cargo_package()",
+        "pkg/Cargo.toml": '[package]\nname = "pkg"\nversion = "0.1.0"',
+        "pkg/Cargo.lock": 'version = 3\n\n[[package]]\nname = "pkg"\nversion = "0.1.0"\n',
+        "pkg/src/main.rs": 'fn main() {\n    println!("hello");\n}\n',
+    })
+    rule_runner.set_options(["--rust-dependency-layer"], env_inherit={"PATH"})
+
+    target = rule_runner.get_target(Address("pkg", target_name="pkg", generated_name="pkg"))
+    binary = rule_runner.request(
+        CargoBinary, [CargoBinaryRequest(target.address, target[CargoPackageSourcesField], "pkg")]
+    )
+    (content,) = rule_runner.request(DigestContents, [binary.digest])
+
+    path = tmp_path / "pkg"
+    path.write_bytes(content.content)
+    path.chmod(0o755)
+    # The stub the dependency layer is built from would print nothing.
+    assert subprocess.run([path], capture_output=True, check=True).stdout == b"hello\n"
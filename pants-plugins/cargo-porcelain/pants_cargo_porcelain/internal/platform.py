@@ -18,3 +18,9 @@ def platform_to_target(platform: Platform) -> str:
         return "aarch64-apple-darwin"
     else:
         raise Exception("Unknown platform")
+
+
+def target_linker_env_var(target: str) -> str:
+    """The environment variable cargo reads the linker for a Rust target-triple from"""
+
+    return f"CARGO_TARGET_{target.upper().replace('-', '_').replace('.', '_')}_LINKER"
@@ -1,9 +1,9 @@
 from . import subsystems, target_generator
 from . import target_types as tt
 from . import tool, tool_rules
-from .goals import fmt, generate_lockfiles, package, run, tailor, test
+from .goals import cache_gc, fmt, generate_lockfiles, package, run, rustup_mirror, tailor, test
 from .internal import build
-from .tools import binstall, mtime
+from .tools import binstall, mtime, nextest
 from .util_rules import cargo, dependency_inference, rustup, sandbox, workspace
 
 
@@ -25,10 +25,13 @@ def rules():
         *target_generator.rules(),
         *workspace.rules(),
         *generate_lockfiles.rules(),
+        *rustup_mirror.rules(),
+        *cache_gc.rules(),
         *tool_rules.rules(),
         *tool.rules(),
         *binstall.rules(),
         *mtime.rules(),
+        *nextest.rules(),
     ]
 
 
@@ -1,6 +1,11 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from pants.base.build_environment import get_buildroot
 from pants.core.util_rules.external_tool import ExternalTool
 from pants.engine.platform import Platform
-from pants.option.option_types import BoolOption, SkipOption, StrOption
+from pants.option.option_types import BoolOption, DictOption, SkipOption, StrListOption, StrOption
 from pants.option.subsystem import Subsystem
 from pants.util.strutil import softwrap
 
@@ -24,8 +29,74 @@ class RustSubsystem(Subsystem):
         advanced=True,
     )
 
+    profile = StrOption(
+        default=None,
+        help=softwrap("""
+            The cargo profile to build with when a target does not set `profile`. If unset, the
+            `release` profile is used if `release` is true, and the `dev` profile otherwise.
+            """),
+        advanced=True,
+    )
+
+    linkers = DictOption[str](
+        help=softwrap("""
+            The linker to use for each target triple that is cross-compiled for, as absolute
+            paths, e.g. `{"aarch64-unknown-linux-gnu": "/usr/bin/aarch64-linux-gnu-gcc"}`. The
+            host uses the C compiler found on the system search path.
+            """),
+        advanced=True,
+    )
+
+    batch_binaries = BoolOption(
+        default=True,
+        help=softwrap("""
+            If true, packaging a binary builds all binaries of its package that share its profile
+            and features in one cargo invocation, instead of one invocation per binary that all
+            wait on the same target directory. This speeds up packaging many binaries of a
+            package, at the cost of building all of them when only one is packaged. `run` always
+            builds only the binary that is run.
+            """),
+        advanced=True,
+    )
+
+    shard_target_cache = BoolOption(
+        default=False,
+        help=softwrap("""
+            If true, every local execution slot builds into its own copy of a package's target
+            directory instead of sharing one. Concurrent cargo processes then no longer wait on
+            cargo's lock of the build directory, at the cost of disk space. A new copy is seeded
+            from the most recently used one, which is cheap on filesystems that support reflinks.
+            """),
+        advanced=True,
+    )
+
+    dependency_layer = BoolOption(
+        default=False,
+        help=softwrap("""
+            If true, the third-party dependencies of a package are first compiled on their own,
+            against stubbed sources, into a target directory that Pants captures as a digest. It
+            only depends on the manifests, the lockfile, the profile and the toolchain, so it can
+            be shared through the local and remote caches. Builds then start from that directory
+            instead of from the local target cache.
+            """),
+        advanced=True,
+    )
+
     skip = SkipOption("fmt", "lint")
 
+    def resolve_profile(self, profile: str | None) -> str:
+        """The cargo profile to use for a target with the given `profile` field."""
+        if profile:
+            return profile
+        if self.profile:
+            return self.profile
+        return "release" if self.release else "dev"
+
+
+def cargo_profile_dir(profile: str) -> str:
+    """The directory in the target directory that cargo puts the artifacts of `profile` in."""
+    return {"dev": "debug", "test": "debug", "bench": "release"}.get(profile, profile)
+
 
 class RustupTool(ExternalTool):
     """The rustup tool."""
@@ -49,18 +120,55 @@ class RustupTool(ExternalTool):
             "macos_x86_64": "x86_64-apple-darwin",
         }
         plat_str = platform_mapping[plat.value]
-        return (
-            f"https://static.rust-lang.org/rustup/archive/{self.version[1:]}/{plat_str}/rustup-init"
-        )
+        return f"{self.dist_server_url}/rustup/archive/{self.version[1:]}/{plat_str}/rustup-init"
 
     def generate_exe(self, plat: Platform) -> str:
         return "./rustup-init"
 
+    @property
+    def dist_server_url(self) -> str:
+        if "://" in self.dist_server:
+            return self.dist_server.rstrip("/")
+
+        return Path(get_buildroot(), self.dist_server).as_uri()
+
     rust_version = StrOption(
         default="stable",
         help=softwrap("""The version of rust to install. If unspecified, stable is used."""),
     )
 
+    hermetic_toolchains = BoolOption(
+        default=False,
+        help=softwrap("""
+            If true, toolchains are built from the official dist archives into content-addressed
+            digests instead of being installed into the `rustup` named cache. This allows them to
+            be cached and shipped to remote executors like any other input. Every archive that is
+            used has to be listed in `known_dist_archives`.
+            """),
+        advanced=True,
+    )
+
+    dist_server = StrOption(
+        default="https://static.rust-lang.org",
+        help=softwrap("""
+            The server to download `rustup`, toolchains and Rust dist archives from. This can be a
+            `file://` URL or a directory, relative to the build root, containing a mirror with the
+            same layout as the official server. Use the `rustup-mirror` goal to populate such a
+            mirror.
+            """),
+        advanced=True,
+    )
+
+    known_dist_archives = StrListOption(
+        default=[],
+        help=softwrap("""
+            Known Rust dist archives, used when `hermetic_toolchains` is enabled. Each entry has
+            the form `<archive_name>|<sha256>|<length>`, where the archive name is the file name
+            without the `.tar.xz` suffix, such as `rust-1.72.1-x86_64-unknown-linux-gnu`.
+            """),
+        advanced=True,
+    )
+
 
 def rules():
     return [
@@ -5,7 +5,7 @@ from pants.engine.platform import Platform
 from pants.engine.rules import QueryRule
 from pants.testutil.rule_runner import RuleRunner
 
-from pants_cargo_porcelain.subsystems import RustupTool
+from pants_cargo_porcelain.subsystems import RustupTool, cargo_profile_dir
 from pants_cargo_porcelain.subsystems import rules as subsystem_rules
 from pants_cargo_porcelain.tool import rules as tool_rules
 from pants_cargo_porcelain.tool_rules import rules as tool_rules_rules
@@ -42,3 +42,17 @@ def test_platform_download_rustup(
 ):
     rustup = rule_runner.request(RustupTool, [])
     rule_runner.request(DownloadedExternalTool, [rustup.get_request(platform)])
+
+
+@pytest.mark.parametrize(
+    "profile, expected",
+    [
+        ("dev", "debug"),
+        ("test", "debug"),
+        ("release", "release"),
+        ("bench", "release"),
+        ("release-lto", "release-lto"),
+    ],
+)
+def test_cargo_profile_dir(profile, expected):
+    assert cargo_profile_dir(profile) == expected
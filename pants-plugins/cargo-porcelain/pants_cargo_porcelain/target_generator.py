@@ -4,14 +4,12 @@ import json
 
 from pants.core.util_rules.source_files import SourceFiles, SourceFilesRequest
 from pants.engine.internals.selectors import Get, MultiGet
-from pants.engine.platform import Platform
 from pants.engine.process import ProcessResult
 from pants.engine.rules import collect_rules, rule
 from pants.engine.target import GeneratedTargets, GenerateTargetsRequest
 from pants.engine.unions import UnionRule
 
-from pants_cargo_porcelain.internal.platform import platform_to_target
-from pants_cargo_porcelain.subsystems import RustSubsystem, RustupTool
+from pants_cargo_porcelain.subsystems import RustSubsystem
 from pants_cargo_porcelain.target_types import (
     CargoBinaryNameField,
     CargoBinaryTarget,
@@ -22,13 +20,17 @@ from pants_cargo_porcelain.target_types import (
     CargoPackageSourcesField,
     CargoPackageTarget,
     CargoPackageTargetImpl,
+    CargoProfileField,
+    CargoRustVersionField,
     CargoSourcesTarget,
+    CargoTargetTriplesField,
     CargoTestNameField,
+    CargoTestShardCountField,
     CargoTestTarget,
     _CargoSourcesMarker,
 )
 from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
-from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
+from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainPinRequest
 
 
 class GenerateCargoTargetsRequest(GenerateTargetsRequest):
@@ -39,8 +41,6 @@ class GenerateCargoTargetsRequest(GenerateTargetsRequest):
 async def generate_cargo_generated_target(
     request: GenerateCargoTargetsRequest,
     rust: RustSubsystem,
-    rustup: RustupTool,
-    platform: Platform,
 ) -> GeneratedTargets:
     source_files, toolchain = await MultiGet(
         Get(
@@ -51,8 +51,9 @@ async def generate_cargo_generated_target(
         ),
         Get(
             RustToolchain,
-            RustToolchainRequest(
-                rustup.rust_version, platform_to_target(platform), ("cargo", "rustfmt")
+            RustToolchainPinRequest(
+                request.generator.address.spec_path,
+                request.generator[CargoRustVersionField].value,
             ),
         ),
     )
@@ -134,6 +135,10 @@ async def generate_cargo_generated_target(
                 {
                     CargoPackageDependenciesField.alias: [package_address],
                     CargoBinaryNameField.alias: target["name"],
+                    # Only binaries are built with a profile or cross-compiled, other generated
+                    # targets lack these fields.
+                    CargoProfileField.alias: request.generator[CargoProfileField].value,
+                    CargoTargetTriplesField.alias: request.generator[CargoTargetTriplesField].value,
                     **request.template,
                 },
                 name,
@@ -148,6 +153,9 @@ async def generate_cargo_generated_target(
                     **request.template,
                     CargoPackageDependenciesField.alias: [package_address],
                     CargoTestNameField.alias: target["name"],
+                    CargoTestShardCountField.alias: request.generator[
+                        CargoTestShardCountField
+                    ].value,
                     CargoPackageSourcesField.alias: [
                         *CargoPackageSourcesField.default,
                         "tests/**/*.rs",
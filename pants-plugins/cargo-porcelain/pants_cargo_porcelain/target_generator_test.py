@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import pytest
+from pants.build_graph.address import Address
+from pants.core.util_rules import external_tool, source_files
+from pants.testutil.rule_runner import RuleRunner
+
+from pants_cargo_porcelain import register, subsystems, target_types
+from pants_cargo_porcelain.target_generator import rules as target_generator_rules
+from pants_cargo_porcelain.target_types import (
+    CargoBinaryTarget,
+    CargoLibraryTarget,
+    CargoProfileField,
+    CargoTargetTriplesField,
+    CargoTestShardCountField,
+    CargoTestTarget,
+)
+from pants_cargo_porcelain.tool import rules as tool_rules
+from pants_cargo_porcelain.tool_rules import rules as tool_rules_rules
+from pants_cargo_porcelain.tools.mtime import rules as mtime_rules
+from pants_cargo_porcelain.util_rules import cargo, rustup, workspace
+
+
+@pytest.fixture
+def rule_runner() -> RuleRunner:
+    rule_runner = RuleRunner(
+        rules=[
+            *subsystems.rules(),
+            *target_types.rules(),
+            *source_files.rules(),
+            *external_tool.rules(),
+            *cargo.rules(),
+            *rustup.rules(),
+            *workspace.rules(),
+            *target_generator_rules(),
+            *tool_rules(),
+            *tool_rules_rules(),
+            *mtime_rules(),
+        ],
+        target_types=register.target_types(),
+    )
+    rule_runner.set_options([], env_inherit={"PATH"})
+    return rule_runner
+
+
+def test_generate_cross_compiled_package(rule_runner: RuleRunner) -> None:
+    rule_runner.write_files({
+        "pkg/BUILD": (
+            'cargo_package(profile="release-lto", target_triples=["x86_64-unknown-linux-musl"],'
+            " shard_count=4)"
+        ),
+        "pkg/Cargo.toml": '[package]\nname = "pkg"\nversion = "0.1.0"',
+        "pkg/src/lib.rs": "",
+        "pkg/src/main.rs": "fn main() {}",
+        "pkg/tests/integration.rs": "",
+    })
+
+    binary = rule_runner.get_target(Address("pkg", target_name="pkg", generated_name="pkg"))
+    library = rule_runner.get_target(Address("pkg", target_name="pkg", generated_name="library"))
+    test = rule_runner.get_target(Address("pkg", target_name="pkg", generated_name="integration"))
+
+    assert isinstance(binary, CargoBinaryTarget)
+    assert binary[CargoProfileField].value == "release-lto"
+    assert binary[CargoTargetTriplesField].value == ("x86_64-unknown-linux-musl",)
+    assert isinstance(library, CargoLibraryTarget)
+    assert not library.has_field(CargoProfileField)
+    assert not library.has_field(CargoTargetTriplesField)
+    assert isinstance(test, CargoTestTarget)
+    assert not test.has_field(CargoProfileField)
+    assert not test.has_field(CargoTargetTriplesField)
+    assert test[CargoTestShardCountField].value == 4
@@ -10,11 +10,14 @@ from pants.engine.target import (
     COMMON_TARGET_FIELDS,
     BoolField,
     Dependencies,
+    IntField,
     InvalidFieldException,
     MultipleSourcesField,
     StringField,
+    StringSequenceField,
     Target,
     TargetGenerator,
+    ValidNumbers,
     generate_multiple_sources_field_help_message,
 )
 from pants.util.strutil import help_text
@@ -78,6 +81,59 @@ class SkipCargoTestsField(BoolField):
     help = "If true, don't run this package's tests."
 
 
+class CargoRustVersionField(StringField):
+    alias = "rust_version"
+    help = help_text("""
+        The Rust toolchain to build this package with. If unset, the channel from the nearest
+        `rust-toolchain.toml` or `rust-toolchain` file is used, falling back to
+        `[rustup].rust_version`.
+        """)
+
+
+class CargoProfileField(StringField):
+    alias = "profile"
+    help = help_text("""
+        The cargo profile to build with, e.g. `release` or a custom profile such as `release-lto`.
+        If unset, `[rust].profile` is used.
+        """)
+
+
+class CargoFeaturesField(StringSequenceField):
+    alias = "features"
+    help = "The cargo features to enable, in addition to the default features."
+
+
+class CargoDefaultFeaturesField(BoolField):
+    alias = "default_features"
+    default = True
+    help = "If false, don't enable the default features of the package."
+
+
+class CargoAllFeaturesField(BoolField):
+    alias = "all_features"
+    default = False
+    help = "If true, enable all features of the package."
+
+
+class CargoTargetTriplesField(StringSequenceField):
+    alias = "target_triples"
+    help = help_text("""
+        The target triples to cross-compile binaries for, e.g. `x86_64-unknown-linux-musl`. One
+        artifact is built per triple. If unset, binaries are built for the host.
+        """)
+
+
+class CargoTestShardCountField(IntField):
+    alias = "shard_count"
+    default = 1
+    valid_numbers = ValidNumbers.positive_only
+    help = help_text("""
+        The number of processes to spread the tests of a test binary over. The tests are listed
+        with the test harness, and every process runs a share of them. On a `cargo_package`, this
+        applies to each of its integration tests.
+        """)
+
+
 class CargoPackageTarget(TargetGenerator):
     alias = "cargo_package"
     core_fields = (
@@ -86,6 +142,13 @@ class CargoPackageTarget(TargetGenerator):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoProfileField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
+        CargoTargetTriplesField,
+        CargoTestShardCountField,
         CargoPackageSourcesField,
         _CargoPackageMarker,
     )
@@ -94,6 +157,10 @@ class CargoPackageTarget(TargetGenerator):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
         _CargoPackageMarker,
     )
     moved_fields = (CargoPackageDependenciesField,)
@@ -124,6 +191,10 @@ class CargoPackageTargetImpl(Target):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
         CargoPackageNameField,
         _CargoPackageMarker,
     )
@@ -141,6 +212,10 @@ class CargoSourcesTarget(Target):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
         CargoPackageNameField,
         _CargoSourcesMarker,
     )
@@ -157,6 +232,12 @@ class CargoBinaryTarget(Target):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoProfileField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
+        CargoTargetTriplesField,
         CargoBinaryNameField,
     )
     help = help_text("""
@@ -172,7 +253,12 @@ class CargoTestTarget(Target):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
         CargoTestNameField,
+        CargoTestShardCountField,
         CargoPackageSourcesField,
     )
     help = help_text("""
@@ -188,6 +274,10 @@ class CargoLibraryTarget(Target):
         SkipCargoTestsField,
         OutputPathField,
         EnvironmentField,
+        CargoRustVersionField,
+        CargoFeaturesField,
+        CargoDefaultFeaturesField,
+        CargoAllFeaturesField,
         CargoLibraryNameField,
     )
     help = help_text("""
@@ -4,7 +4,7 @@ from dataclasses import dataclass
 
 from pants.engine.fs import Digest
 from pants.engine.rules import collect_rules
-from pants.option.option_types import BoolOption, StrOption
+from pants.option.option_types import BoolOption, IntOption, StrOption
 from pants.option.subsystem import Subsystem
 from pants.util.strutil import softwrap
 
@@ -62,6 +62,64 @@ class Sccache(RustTool):
             """),
     )
 
+    log_level = StrOption(
+        default=None,
+        advanced=True,
+        help=softwrap("""
+            The `SCCACHE_LOG` filter for `sccache`, e.g. `info` or `debug`. Logging is off by
+            default, as verbose logs are written for every compilation unit.
+            """),
+    )
+
+    report_stats = BoolOption(
+        default=False,
+        help=softwrap("""
+            If true, log the `sccache` hit rate of every cargo build.
+            """),
+    )
+
+    cache_size = StrOption(
+        default="10G",
+        advanced=True,
+        help=softwrap("""
+            The maximum size of the local `sccache` cache, e.g. `10G` or `500M`. `sccache` evicts
+            the least recently used entries once it is exceeded.
+            """),
+    )
+
+    server_port_base = IntOption(
+        default=4226,
+        advanced=True,
+        help=softwrap("""
+            Each local execution slot talks to its own long-lived `sccache` server, listening on
+            this port plus the slot number. Concurrent cargo processes therefore never race to
+            start a server on the same port, and consecutive processes in a slot reuse a warm one.
+            """),
+    )
+
+    idle_timeout = IntOption(
+        default=600,
+        advanced=True,
+        help=softwrap("""
+            Seconds after which an idle `sccache` server shuts itself down. Servers outlive the
+            processes that start them, so this is what stops them once Pants is done. Set to 0 to
+            keep servers running until they are stopped explicitly.
+            """),
+    )
+
+
+def format_sccache_stats(stats: dict) -> str:
+    """Summarize the output of `sccache --show-stats --stats-format=json`."""
+    stats = stats["stats"]
+    hits = sum(stats["cache_hits"]["counts"].values())
+    misses = sum(stats["cache_misses"]["counts"].values())
+    uncacheable = stats["requests_not_cacheable"]
+
+    summary = f"{hits} hits, {misses} misses, {uncacheable} not cacheable"
+    if hits + misses:
+        summary += f" ({hits / (hits + misses):.0%} hit rate)"
+    return summary
+
 
 def rules():
     return [
@@ -8,7 +8,7 @@ from pants.engine.rules import Get, collect_rules, rule
 
 from pants_cargo_porcelain.internal.platform import platform_to_target
 from pants_cargo_porcelain.subsystems import RustupTool
-from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest
+from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest, Sccache
 from pants_cargo_porcelain.tools.binstall import BinstallTool
 from pants_cargo_porcelain.util_rules.cargo import CargoProcessRequest
 from pants_cargo_porcelain.util_rules.rustup import RustToolchain, RustToolchainRequest
@@ -23,9 +23,7 @@ async def get_rust_tool(
 ) -> InstalledRustTool:
     toolchain = await Get(
         RustToolchain,
-        RustToolchainRequest(
-            rustup.rust_version, platform_to_target(platform), ("cargo", "rustfmt")
-        ),
+        RustToolchainRequest(rustup.rust_version, platform_to_target(platform)),
     )
 
     if binstall.enable:
@@ -62,6 +60,8 @@ async def get_rust_tool(
                     f"--version={request.version}",
                 ),
                 output_files=(request.tool_name,),
+                # `sccache` cannot be used to build itself.
+                compiler_cache=request.tool_name != Sccache.project_name,
             ),
         )
 
@@ -5,7 +5,12 @@ from pants.engine.rules import QueryRule
 from pants.testutil.rule_runner import RuleRunner
 
 from pants_cargo_porcelain.subsystems import rules as subsystem_rules
-from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest, Sccache
+from pants_cargo_porcelain.tool import (
+    InstalledRustTool,
+    RustToolRequest,
+    Sccache,
+    format_sccache_stats,
+)
 from pants_cargo_porcelain.tool import rules as tool_rules
 from pants_cargo_porcelain.tool_rules import rules as tool_rules_rules
 from pants_cargo_porcelain.tools.binstall import rules as binstall_rules
@@ -37,3 +42,22 @@ def test_platform_install_sccache(
     rule_runner.set_options(["--binstall-enable"])
     sccache = rule_runner.request(Sccache, [])
     rule_runner.request(InstalledRustTool, [sccache.as_tool_request()])
+
+
+@pytest.mark.parametrize(
+    "hits, misses, expected",
+    [
+        ({}, {}, "0 hits, 0 misses, 2 not cacheable"),
+        ({"Rust": 3}, {"Rust": 1}, "3 hits, 1 misses, 2 not cacheable (75% hit rate)"),
+        ({"Rust": 1, "C/C++": 1}, {}, "2 hits, 0 misses, 2 not cacheable (100% hit rate)"),
+    ],
+)
+def test_format_sccache_stats(hits, misses, expected):
+    stats = {
+        "stats": {
+            "cache_hits": {"counts": hits},
+            "cache_misses": {"counts": misses},
+            "requests_not_cacheable": 2,
+        }
+    }
+    assert format_sccache_stats(stats) == expected
@@ -0,0 +1,34 @@
+from pants.option.option_types import BoolOption
+from pants.util.strutil import softwrap
+
+from pants_cargo_porcelain.tool import RustTool
+
+
+class CargoNextest(RustTool):
+    """The `cargo nextest` test runner."""
+
+    options_scope = "cargo-nextest"
+    help = softwrap("""
+    `cargo nextest` runs every test in a process of its own, which isolates failures and
+    parallelizes large test suites better than the libtest harness.
+    """)
+
+    project_name = "cargo-nextest"
+    default_version = "0.9.105"
+
+    enabled = BoolOption(
+        default=False,
+        help=softwrap("""
+            If true, the `test` goal runs tests with `cargo nextest` instead of `cargo test`. The
+            tests of a package are built into a `cargo nextest archive` once, which every test
+            target then runs its tests from. Failed tests are retried up to
+            `[test].attempts_default` times by `nextest`, and a JUnit report is collected for
+            `[test].report`.
+            """),
+    )
+
+
+def rules():
+    return [
+        *CargoNextest.rules(),
+    ]
@@ -13,13 +13,15 @@ from pants.core.util_rules.system_binaries import (
     BinaryShimsRequest,
     SystemBinariesSubsystem,
 )
-from pants.engine.fs import EMPTY_DIGEST, CreateDigest, Digest, FileContent, MergeDigests
+from pants.engine.fs import EMPTY_DIGEST, AddPrefix, CreateDigest, Digest, FileContent, MergeDigests
 from pants.engine.process import Process
 from pants.engine.rules import Get, collect_rules, rule
 from pants.util.frozendict import FrozenDict
 from pants.util.logging import LogLevel
 
-from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest
+from pants_cargo_porcelain.internal.platform import target_linker_env_var
+from pants_cargo_porcelain.subsystems import RustSubsystem
+from pants_cargo_porcelain.tool import InstalledRustTool, RustToolRequest, Sccache
 from pants_cargo_porcelain.tools.mtime import CargoMtime
 from pants_cargo_porcelain.util_rules.rustup import (
     BOTH_CACHES,
@@ -36,8 +38,17 @@ class CargoProcessRequest:
 
     digest: Digest = EMPTY_DIGEST
     output_files: tuple[str, ...] = ()
+    output_directories: tuple[str, ...] = ()
+    # Copy the executables and dynamic libraries that cargo reports to this directory, which has to
+    # be captured through `output_directories`. Requires `--message-format=json`.
+    executables_dir: str | None = None
 
     cache_path: str | None = None
+    # Build in a target directory inside the sandbox, seeded from this digest, instead of in the
+    # target cache. Unlike the target cache, the result can be cached remotely.
+    target_dir_digest: Digest | None = None
+    # Whether cargo compiles Rust code and should go through `sccache`, if it is enabled.
+    compiler_cache: bool = False
 
     description: str | None = None
 
@@ -51,11 +62,213 @@ class CargoProcess:
     request: Process
 
 
+CARGO_TARGET_CACHE = ".cargo-target-cache"
+SANDBOX_TARGET_DIR = ".cargo-target"
+
+_WRAPPER_DIR = ".cargo-porcelain"
+
+SCCACHE_STATS_FILE = ".sccache-stats.json"
+
+# A shared wrapper for cargo processes that need more than a plain cargo invocation. All per-process
+# configuration is passed through the environment, so the script, and thus its digest, is the same
+# for every process.
+_WRAPPER_SCRIPT = """\
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Directories are cloned when the filesystem supports it.
+clone() {
+    cp -R --reflink=always "$1" "$2" 2>/dev/null && return
+    rm -rf "$2"
+    cp -Rc "$1" "$2" 2>/dev/null && return
+    rm -rf "$2"
+    return 1
+}
+
+# Outputs are cloned when the filesystem supports it, hard linked when the sandbox and the cache
+# share a filesystem, and only copied as a last resort.
+extract() {
+    clone "$1" "$2" && return
+    [[ -f "$1" ]] && ln "$1" "$2" 2>/dev/null && return
+    rm -rf "$2"
+    cp -R "$1" "$2"
+}
+
+# With sharding, every execution slot builds into its own copy of the target directory, so that
+# concurrent processes do not wait on cargo's build directory lock. A new shard is seeded from the
+# most recently used one, along with its mtime database. The mtime of a directory only changes with
+# its top-level entries, so every successful run touches a marker file to record its use instead. A
+# copy is only marked once a run in it succeeds, and copies still being made are never used as seeds.
+last_used_marker=""
+if [[ -n "${__CARGO_PORCELAIN_SHARD_TARGET_DIR:-}" && -n "${__CARGO_PORCELAIN_SLOT:-}" ]]; then
+    base="$CARGO_TARGET_DIR"
+    export CARGO_TARGET_DIR="$base.slot-$__CARGO_PORCELAIN_SLOT"
+    if [[ -n "${CARGO_MTIME_DB_PATH:-}" ]]; then
+        export CARGO_MTIME_DB_PATH="$CARGO_TARGET_DIR.db"
+    fi
+
+    if [[ ! -d "$CARGO_TARGET_DIR" ]]; then
+        seed=""
+        for candidate in "$base" "$base".slot-*; do
+            if [[ ! -d "$candidate" || "${candidate#"$base"}" == *.tmp.* ]]; then
+                continue
+            fi
+            marker="$candidate/.cargo-porcelain-last-used"
+            if [[ -z "$seed" || "$marker" -nt "$seed/.cargo-porcelain-last-used" ]]; then
+                seed="$candidate"
+            fi
+        done
+
+        if [[ -n "$seed" ]]; then
+            tmp="$CARGO_TARGET_DIR.tmp.$$"
+            clone "$seed" "$tmp" || cp -R "$seed" "$tmp"
+            rm -f "$tmp/.cargo-porcelain-last-used"
+            mv "$tmp" "$CARGO_TARGET_DIR"
+            if [[ -f "$seed.db" ]]; then
+                cp "$seed.db" "$CARGO_TARGET_DIR.db"
+            fi
+        fi
+    fi
+    last_used_marker="$CARGO_TARGET_DIR/.cargo-porcelain-last-used"
+fi
+
+# Named caches are symlinked into the sandbox. Resolve them so cargo sees the same paths every time.
+for var in ${__CARGO_PORCELAIN_REALPATH_ENV:-}; do
+    mkdir -p "${!var}"
+    export "$var=$(realpath "${!var}")"
+done
+
+# Every execution slot has its own sccache server, so that concurrent processes never share a port.
+# The server outlives this process and is reused by the next one in the same slot. A server that no
+# longer answers is restarted.
+if [[ -n "${RUSTC_WRAPPER:-}" && -n "${__CARGO_PORCELAIN_SLOT:-}" ]]; then
+    export SCCACHE_SERVER_PORT=$((SCCACHE_SERVER_PORT_BASE + __CARGO_PORCELAIN_SLOT))
+    if ! "$RUSTC_WRAPPER" --show-stats >/dev/null 2>&1; then
+        "$RUSTC_WRAPPER" --stop-server >/dev/null 2>&1 || true
+        "$RUSTC_WRAPPER" --start-server >/dev/null
+    fi
+    if [[ -n "${__CARGO_PORCELAIN_SCCACHE_STATS:-}" ]]; then
+        "$RUSTC_WRAPPER" --zero-stats >/dev/null
+    fi
+fi
+
+for step in ${__CARGO_PORCELAIN_PRE_STEPS:-}; do
+    "$step"
+done
+
+if [[ -n "${__CARGO_PORCELAIN_EXECUTABLES:-}" ]]; then
+    # Pass cargo's JSON messages on, and collect every executable they report along the way, along
+    # with the dynamic libraries that executables may link against. Proc macros are dynamic
+    # libraries too, but only the compiler loads them.
+    messages="$__CARGO_PORCELAIN_EXECUTABLES.json"
+    status=0
+    "$@" >"$messages" || status=$?
+    mkdir -p "$__CARGO_PORCELAIN_EXECUTABLES"
+    executable_pattern='"executable":"([^"]+)"'
+    library_pattern='"([^"]+[.](so|dylib))"'
+    libraries=""
+    while IFS= read -r line || [[ -n "$line" ]]; do
+        printf '%s\n' "$line"
+        if [[ "$line" != *'"reason":"compiler-artifact"'* ]]; then
+            continue
+        fi
+        if [[ "$line" =~ $executable_pattern ]]; then
+            executable="${BASH_REMATCH[1]}"
+            extract "$executable" "$__CARGO_PORCELAIN_EXECUTABLES/$(basename "$executable")"
+        fi
+        rest="$line"
+        while [[ "$rest" != *'"proc-macro"'* && "$rest" =~ $library_pattern ]]; do
+            library="${BASH_REMATCH[1]}"
+            rest="${rest#*"${BASH_REMATCH[0]}"}"
+            destination="$__CARGO_PORCELAIN_EXECUTABLES/$(basename "$library")"
+            if [[ ! -e "$destination" ]]; then
+                extract "$library" "$destination"
+            fi
+            libraries=1
+        done
+    done <"$messages"
+    # Linking against a Rust dynamic library also links the standard library dynamically.
+    if [[ -n "$libraries" ]]; then
+        for library in "$("${RUSTC:-rustc}" --print target-libdir)"/*.{so,dylib}; do
+            if [[ -e "$library" ]]; then
+                extract "$library" "$__CARGO_PORCELAIN_EXECUTABLES/$(basename "$library")"
+            fi
+        done
+    fi
+    if [[ "$status" -ne 0 ]]; then
+        exit "$status"
+    fi
+else
+    "$@"
+fi
+
+if [[ -n "$last_used_marker" ]]; then
+    touch "$last_used_marker"
+fi
+
+if [[ -n "${__CARGO_PORCELAIN_SCCACHE_STATS:-}" ]]; then
+    "$RUSTC_WRAPPER" --show-stats --stats-format=json >"$__CARGO_PORCELAIN_SCCACHE_STATS"
+fi
+
+for output in ${__CARGO_PORCELAIN_OUTPUTS:-}; do
+    extract "$CARGO_TARGET_DIR/$output" "$(basename "$output")"
+done
+"""
+
+
+@dataclass(frozen=True)
+class CargoInvocation:
+    """A cargo invocation, along with the steps that have to run around it."""
+
+    argv: tuple[str, ...]
+    env: FrozenDict[str, str]
+
+    # Environment variables that point into named caches and have to be resolved to real paths.
+    realpath_env: tuple[str, ...] = ()
+    # Commands to run before cargo, such as `cargo-mtime`.
+    pre_steps: tuple[str, ...] = ()
+    # Files in the target directory to copy into the sandbox after cargo has run.
+    outputs: tuple[str, ...] = ()
+    # Whether the target directory is sharded by execution slot.
+    shard_target_dir: bool = False
+    # A directory to copy the executables that cargo reports in its JSON messages to.
+    executables_dir: str | None = None
+
+    @property
+    def needs_wrapper(self) -> bool:
+        return bool(
+            self.realpath_env
+            or self.pre_steps
+            or self.outputs
+            or self.uses_sccache
+            or self.shard_target_dir
+            or self.executables_dir
+        )
+
+    @property
+    def needs_execution_slot(self) -> bool:
+        return self.uses_sccache or self.shard_target_dir
+
+    @property
+    def uses_sccache(self) -> bool:
+        return "RUSTC_WRAPPER" in self.env
+
+    def wrapped_env(self) -> dict[str, str]:
+        return {
+            **self.env,
+            "__CARGO_PORCELAIN_REALPATH_ENV": " ".join(self.realpath_env),
+            "__CARGO_PORCELAIN_PRE_STEPS": " ".join(self.pre_steps),
+            "__CARGO_PORCELAIN_OUTPUTS": " ".join(self.outputs),
+            "__CARGO_PORCELAIN_SHARD_TARGET_DIR": "1" if self.shard_target_dir else "",
+            "__CARGO_PORCELAIN_EXECUTABLES": self.executables_dir or "",
+        }
+
+
 class CCBinary(BinaryPath):
-    """Path to the rustup binary used to select and gain access to Rust toolchains."""
+    """Path to the C compiler used as the linker for Rust binaries."""
 
 
-@rule(desc="Finding the `zip` binary", level=LogLevel.DEBUG)
+@rule(desc="Finding the `cc` binary", level=LogLevel.DEBUG)
 async def find_cc(system_binaries: SystemBinariesSubsystem.EnvironmentAware) -> CCBinary:
     request = BinaryPathRequest(
         binary_name="cc",
@@ -63,53 +276,38 @@ async def find_cc(system_binaries: SystemBinariesSubsystem.EnvironmentAware) ->
         test=BinaryPathTest(args=["-v"]),
     )
     paths = await Get(BinaryPaths, BinaryPathRequest, request)
-    first_path = paths.first_path_or_raise(request, rationale="create `.zip` archives")
+    first_path = paths.first_path_or_raise(request, rationale="link Rust binaries")
     return CCBinary(first_path.path, first_path.fingerprint)
 
 
-class LDBinary(BinaryPath):
-    """Path to the rustup binary used to select and gain access to Rust toolchains."""
-
-
-@rule(desc="Finding the `zip` binary", level=LogLevel.DEBUG)
-async def find_ld(system_binaries: SystemBinariesSubsystem.EnvironmentAware) -> LDBinary:
-    request = BinaryPathRequest(
-        binary_name="ld",
-        search_path=system_binaries.system_binary_paths,
-        test=BinaryPathTest(args=["-v"]),
-    )
-    paths = await Get(BinaryPaths, BinaryPathRequest, request)
-    first_path = paths.first_path_or_raise(request, rationale="create `.zip` archives")
-    return LDBinary(first_path.path, first_path.fingerprint)
+@dataclass(frozen=True)
+class CargoExecutionEnvironment:
+    """The system binaries and search path shared by every cargo process in an environment.
 
+    This only depends on the environment, so it is computed once and reused by all cargo
+    processes in a run.
+    """
 
-class RealpathBinary(BinaryPath):
-    pass
+    bash: BashBinary
+    cc: CCBinary
+    binary_shims: BinaryShims
+    wrapper_digest: Digest
 
+    @property
+    def path(self) -> str:
+        return self.binary_shims.path_component
 
-@rule(desc="Finding the `realpath` binary", level=LogLevel.DEBUG)
-async def find_realpath(
-    system_binaries: SystemBinariesSubsystem.EnvironmentAware,
-) -> RealpathBinary:
-    request = BinaryPathRequest(
-        binary_name="realpath",
-        search_path=system_binaries.system_binary_paths,
-        test=BinaryPathTest(args=["-v"]),
-    )
-    paths = await Get(BinaryPaths, BinaryPathRequest, request)
-    first_path = paths.first_path_or_raise(request, rationale="resolve named caches")
-    return LDBinary(first_path.path, first_path.fingerprint)
+    @property
+    def immutable_input_digests(self) -> FrozenDict[str, Digest]:
+        return self.binary_shims.immutable_input_digests
 
 
-@rule(level=LogLevel.DEBUG, desc="Determine candidate Cargo targets to create")
-async def make_cargo_process(
-    req: CargoProcessRequest,
-    cc: CCBinary,
-    ld: LDBinary,
+@rule(desc="Prepare cargo execution environment", level=LogLevel.DEBUG)
+async def get_cargo_execution_environment(
     bash: BashBinary,
-    mtime: CargoMtime,
+    cc: CCBinary,
     system_binaries_environment: SystemBinariesSubsystem.EnvironmentAware,
-) -> Process:
+) -> CargoExecutionEnvironment:
     binary_shims = await Get(
         BinaryShims,
         BinaryShimsRequest.for_binaries(
@@ -119,89 +317,141 @@ async def make_cargo_process(
             "as",
             "ar",
             "realpath",
+            "basename",
+            "mkdir",
+            "ln",
+            "rm",
+            "mv",
+            "touch",
             rationale="rustc",
             search_path=system_binaries_environment.system_binary_paths,
         ),
     )
 
+    wrapper_digest = await Get(
+        Digest, CreateDigest([FileContent("run.sh", _WRAPPER_SCRIPT.encode(), is_executable=True)])
+    )
+
+    return CargoExecutionEnvironment(bash, cc, binary_shims, wrapper_digest)
+
+
+@rule(level=LogLevel.DEBUG, desc="Prepare cargo process")
+async def make_cargo_process(
+    req: CargoProcessRequest,
+    cargo_env: CargoExecutionEnvironment,
+    rust: RustSubsystem,
+    sccache: Sccache,
+    mtime: CargoMtime,
+) -> Process:
     append_only_caches = FrozenDict({**BOTH_CACHES, **req.append_only_caches})
     env = {
-        "PATH": f"{{chroot}}:{{chroot}}/{req.toolchain.path}/bin:{binary_shims.path_component}",
-        "RUSTUP_HOME": RUSTUP_NAMED_CACHE,
-        "CARGO_HOME": CARGO_NAMED_CACHE,
-        "RUSTFLAGS": f"-C linker={cc.path}",
+        "PATH": f"{{chroot}}:{{chroot}}/{req.toolchain.path}/bin:{cargo_env.path}",
+        "RUSTUP_HOME": f"{{chroot}}/{RUSTUP_NAMED_CACHE}",
+        "CARGO_HOME": f"{{chroot}}/{CARGO_NAMED_CACHE}",
+        **{target_linker_env_var(target): linker for target, linker in rust.linkers.items()},
+        target_linker_env_var(req.toolchain.target): cargo_env.cc.path,
         **req.env,
     }
-    mtime_script = ""
+    pre_steps = []
 
     immutable_input_digests = {**req.immutable_input_digests}
-    if mtime.enabled and req.cache_path:
+    if sccache.enabled and req.compiler_cache:
+        sccache_tool = await Get(InstalledRustTool, RustToolRequest, sccache.as_tool_request())
+        immutable_input_digests[".sccache"] = sccache_tool.digest
+        env["RUSTC_WRAPPER"] = "{chroot}/.sccache/sccache"
+        if sccache.log_level:
+            env["SCCACHE_LOG"] = sccache.log_level
+        # The cache directory is fixed when a server starts, and servers are shared between
+        # packages and goals, so every process has to use the same one.
+        env["SCCACHE_DIR"] = "{chroot}/.sccache-cache"
+        env["SCCACHE_CACHE_SIZE"] = sccache.cache_size
+        env["SCCACHE_IDLE_TIMEOUT"] = str(sccache.idle_timeout)
+        env["SCCACHE_SERVER_PORT_BASE"] = str(sccache.server_port_base)
+        append_only_caches = FrozenDict({**append_only_caches, "sccache": ".sccache-cache"})
+
+    # A target directory seeded from a digest is not in the target cache, which the mtime database
+    # belongs to.
+    if mtime.enabled and req.cache_path and req.target_dir_digest is None:
         mtime_tool = await Get(InstalledRustTool, RustToolRequest, mtime.as_tool_request())
         immutable_input_digests[".cargo-mtime"] = mtime_tool.digest
-        env["CARGO_MTIME_DB_PATH"] = f".cargo-target-cache/{req.cache_path}.db"
+        env["CARGO_MTIME_DB_PATH"] = f"{CARGO_TARGET_CACHE}/{req.cache_path}.db"
         env["CARGO_MTIME_ROOT"] = "."
-        mtime_script = "cargo-mtime"
-
-    if immutable_input_digests:
-        for path, digest in immutable_input_digests.items():
-            env["PATH"] = f"{{chroot}}/{path}:{env['PATH']}"
-
-    command = " ".join(req.command)
-
-    target_dir_string = ""
-    output_files = req.output_files
-    if req.cache_path:
-        append_only_caches = FrozenDict({"ctc": ".cargo-target-cache", **append_only_caches})
-        target_dir_string = (
-            f"export CARGO_TARGET_DIR=$(realpath .cargo-target-cache)/{req.cache_path}"
-        )
-
-        output_files = tuple(
-            f.replace("{cache_path}", f".cargo-target-cache/{req.cache_path}") for f in output_files
-        )
-
-    copy_files = []
+        pre_steps.append("cargo-mtime")
+
+    for path in immutable_input_digests:
+        env["PATH"] = f"{{chroot}}/{path}:{env['PATH']}"
+
+    input_digest = req.digest
+    realpath_env = []
+    if req.target_dir_digest is not None:
+        target_dir_digest = await Get(Digest, AddPrefix(req.target_dir_digest, SANDBOX_TARGET_DIR))
+        input_digest = await Get(Digest, MergeDigests([req.digest, target_dir_digest]))
+        env["CARGO_TARGET_DIR"] = f"{{chroot}}/{SANDBOX_TARGET_DIR}"
+        # Registry sources are referenced by absolute paths, which have to be the same in every
+        # sandbox for the compiled dependencies to be reused.
+        realpath_env = ["CARGO_HOME", "RUSTUP_HOME"]
+    elif req.cache_path:
+        append_only_caches = FrozenDict({"ctc": CARGO_TARGET_CACHE, **append_only_caches})
+        env["CARGO_TARGET_DIR"] = f"{{chroot}}/{CARGO_TARGET_CACHE}/{req.cache_path}"
+        realpath_env = ["CARGO_HOME", "RUSTUP_HOME", "CARGO_TARGET_DIR"]
+
+    if "SCCACHE_DIR" in env:
+        realpath_env.append("SCCACHE_DIR")
+
+    copied_outputs = []
     new_output_files = []
-    for file in output_files:
-        if "cargo-target-cache" not in file:
+    for file in req.output_files:
+        if not file.startswith("{cache_path}/"):
             new_output_files.append(file)
             continue
 
-        output_file = os.path.basename(file)
-        copy_files.append(f"cp -r {file} {output_file}")
-        new_output_files.append(output_file)
-
-    copy_files = "\n".join(copy_files)
-    script = f"""
-    #!/usr/bin/env bash
-    set -euo pipefail
-    export CARGO_HOME=$(realpath .cargo)
-    export RUSTUP_HOME=$(realpath .rustup)
-    export SCCACHE_DIR=$(realpath .sccache-cache)/{req.cache_path}
-    {target_dir_string}
-    export SCCACHE_SERVER_PORT=$((1024+ RANDOM % 20000))
-    {mtime_script}
-    {req.toolchain.cargo} {command}
-    {copy_files}
-    """
+        if req.target_dir_digest is not None:
+            new_output_files.append(file.replace("{cache_path}", SANDBOX_TARGET_DIR))
+            continue
+
+        copied_outputs.append(file.removeprefix("{cache_path}/"))
+        new_output_files.append(os.path.basename(file))
+
+    invocation = CargoInvocation(
+        argv=(req.toolchain.cargo, *req.command),
+        env=FrozenDict(env),
+        realpath_env=tuple(realpath_env),
+        pre_steps=tuple(pre_steps),
+        outputs=tuple(copied_outputs),
+        executables_dir=req.executables_dir,
+        shard_target_dir=(
+            bool(req.cache_path) and req.target_dir_digest is None and rust.shard_target_cache
+        ),
+    )
 
-    digest = await Get(Digest, CreateDigest([FileContent("run.sh", script.encode())]))
-    merged_digest = await Get(Digest, MergeDigests([digest, req.digest]))
+    argv = invocation.argv
+    env = invocation.env
+    if invocation.needs_wrapper:
+        argv = (cargo_env.bash.path, f"{_WRAPPER_DIR}/run.sh", *invocation.argv)
+        env = invocation.wrapped_env()
+        immutable_input_digests[_WRAPPER_DIR] = cargo_env.wrapper_digest
 
     description = req.description or f'Run `cargo {" ".join(req.command)}`'
 
     return Process(
-        argv=(bash.path, "run.sh"),
-        input_digest=merged_digest,
+        argv=argv,
+        input_digest=input_digest,
         description=description,
         append_only_caches=append_only_caches,
         output_files=new_output_files,
+        output_directories=tuple(
+            d.replace("{cache_path}", SANDBOX_TARGET_DIR) for d in req.output_directories
+        ),
         immutable_input_digests={
-            **binary_shims.immutable_input_digests,
+            **cargo_env.immutable_input_digests,
+            **req.toolchain.immutable_input_digests,
             **immutable_input_digests,
         },
         level=LogLevel.DEBUG,
         env=env,
+        execution_slot_variable=(
+            "__CARGO_PORCELAIN_SLOT" if invocation.needs_execution_slot else None
+        ),
     )
 
 
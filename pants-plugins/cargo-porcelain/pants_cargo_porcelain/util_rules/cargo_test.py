@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import os
+import subprocess
+
+from pants_cargo_porcelain.util_rules.cargo import _WRAPPER_SCRIPT
+
+_MARKER = ".cargo-porcelain-last-used"
+
+
+def write_target_dir(path, content: str, last_used: int | None = None) -> None:
+    path.mkdir(parents=True)
+    (path / "artifact").write_text(content)
+    (path.parent / f"{path.name}.db").write_text(content)
+    if last_used is not None:
+        (path / _MARKER).write_text("")
+        os.utime(path / _MARKER, (last_used, last_used))
+
+
+def run_wrapper(tmp_path, slot: int, command: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["bash", "-c", _WRAPPER_SCRIPT, "run.sh", "bash", "-c", command],
+        cwd=tmp_path,
+        env={
+            "PATH": os.environ["PATH"],
+            "CARGO_TARGET_DIR": str(tmp_path / "pkg"),
+            "CARGO_MTIME_DB_PATH": str(tmp_path / "pkg.db"),
+            "__CARGO_PORCELAIN_SHARD_TARGET_DIR": "1",
+            "__CARGO_PORCELAIN_SLOT": str(slot),
+        },
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_shard_is_seeded_from_most_recently_used_sibling(tmp_path) -> None:
+    write_target_dir(tmp_path / "pkg.slot-1", "warm", last_used=2000)
+    # Created last, but used longest ago.
+    write_target_dir(tmp_path / "pkg.slot-2", "cold", last_used=1000)
+    write_target_dir(tmp_path / "pkg", "unused")
+
+    result = run_wrapper(tmp_path, 3, 'echo "$CARGO_TARGET_DIR $CARGO_MTIME_DB_PATH"')
+
+    assert result.returncode == 0, result.stderr
+    shard = tmp_path / "pkg.slot-3"
+    assert result.stdout.split() == [str(shard), f"{shard}.db"]
+    assert (shard / "artifact").read_text() == "warm"
+    assert (tmp_path / "pkg.slot-3.db").read_text() == "warm"
+    assert not list(tmp_path.glob("pkg.slot-3.tmp.*"))
+
+
+def test_shard_is_not_seeded_from_partial_copy(tmp_path) -> None:
+    write_target_dir(tmp_path / "pkg", "full", last_used=1000)
+    # Another shard still being seeded, or left behind by a killed process.
+    partial = tmp_path / "pkg.slot-1.tmp.4242"
+    partial.mkdir()
+    (partial / _MARKER).write_text("")
+
+    result = run_wrapper(tmp_path, 2, "true")
+
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "pkg.slot-2" / "artifact").read_text() == "full"
+
+
+def test_seeded_shard_is_unmarked_until_a_run_succeeds(tmp_path) -> None:
+    write_target_dir(tmp_path / "pkg.slot-1", "warm", last_used=1000)
+
+    assert run_wrapper(tmp_path, 2, "exit 3").returncode == 3
+
+    assert (tmp_path / "pkg.slot-2" / "artifact").read_text() == "warm"
+    assert not (tmp_path / "pkg.slot-2" / _MARKER).exists()
+
+
+def test_existing_shard_is_reused(tmp_path) -> None:
+    write_target_dir(tmp_path / "pkg.slot-1", "own", last_used=1000)
+    write_target_dir(tmp_path / "pkg.slot-2", "other", last_used=2000)
+
+    result = run_wrapper(tmp_path, 1, 'cat "$CARGO_TARGET_DIR/artifact"')
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "own"
+
+
+def test_only_successful_runs_mark_shard_as_used(tmp_path) -> None:
+    write_target_dir(tmp_path / "pkg.slot-1", "a", last_used=1000)
+    write_target_dir(tmp_path / "pkg.slot-2", "b", last_used=1000)
+
+    assert run_wrapper(tmp_path, 1, "true").returncode == 0
+    assert run_wrapper(tmp_path, 2, "exit 3").returncode == 3
+
+    assert os.path.getmtime(tmp_path / "pkg.slot-1" / _MARKER) > 1000
+    assert os.path.getmtime(tmp_path / "pkg.slot-2" / _MARKER) == 1000
+
+
+def test_first_shard_is_created_empty(tmp_path) -> None:
+    result = run_wrapper(tmp_path, 1, 'mkdir -p "$CARGO_TARGET_DIR"')
+
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "pkg.slot-1" / _MARKER).exists()
+
+
+def test_collects_executables_and_dynamic_libraries(tmp_path) -> None:
+    target_dir = tmp_path / "target"
+    (target_dir / "debug" / "deps").mkdir(parents=True)
+    for name in ("it-0123", "cli", "libdyl.so", "libmacro.so"):
+        (target_dir / "debug" / "deps" / name).write_text(name)
+    messages = tmp_path / "messages.json"
+    messages.write_text(
+        "\n".join([
+            (
+                '{"reason":"compiler-artifact","target":{"kind":["test"]},'
+                f'"filenames":["{target_dir}/debug/deps/it-0123"],'
+                f'"executable":"{target_dir}/debug/deps/it-0123"}}'
+            ),
+            (
+                '{"reason":"compiler-artifact","target":{"kind":["bin"]},'
+                f'"filenames":["{target_dir}/debug/deps/cli"],'
+                f'"executable":"{target_dir}/debug/deps/cli"}}'
+            ),
+            (
+                '{"reason":"compiler-artifact","target":{"kind":["dylib"]},'
+                f'"filenames":["{target_dir}/debug/deps/libdyl.so"],"executable":null}}'
+            ),
+            (
+                '{"reason":"compiler-artifact","target":{"kind":["proc-macro"]},'
+                f'"filenames":["{target_dir}/debug/deps/libmacro.so"],"executable":null}}'
+            ),
+            '{"reason":"build-finished","success":true}',
+        ])
+    )
+    sysroot_lib = tmp_path / "sysroot"
+    sysroot_lib.mkdir()
+    (sysroot_lib / "libstd-abcd.so").write_text("std")
+    rustc = tmp_path / "rustc"
+    rustc.write_text(f"#!/usr/bin/env bash\necho {sysroot_lib}\n")
+    rustc.chmod(0o755)
+
+    result = subprocess.run(
+        ["bash", "-c", _WRAPPER_SCRIPT, "run.sh", "cat", str(messages)],
+        cwd=tmp_path,
+        env={
+            "PATH": os.environ["PATH"],
+            "RUSTC": str(rustc),
+            "CARGO_TARGET_DIR": str(target_dir),
+            "__CARGO_PORCELAIN_EXECUTABLES": "binaries",
+        },
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == messages.read_text() + "\n"
+    assert sorted(os.listdir(tmp_path / "binaries")) == [
+        "cli",
+        "it-0123",
+        "libdyl.so",
+        "libstd-abcd.so",
+    ]
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from pants.core.util_rules import archive
+from pants.core.util_rules.archive import ExtractedArchive, MaybeExtractArchiveRequest
+from pants.engine.fs import (
+    Digest,
+    DigestContents,
+    DigestSubset,
+    DownloadFile,
+    FileDigest,
+    PathGlobs,
+)
+from pants.engine.rules import Get, collect_rules, rule
+from pants.util.logging import LogLevel
+
+from pants_cargo_porcelain.subsystems import RustupTool
+
+
+class UnknownDistArchiveError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RustDistArchiveRequest:
+    """A request for an archive from the Rust dist server, such as `rust-1.72.1-<triple>`."""
+
+    name: str
+
+
+@dataclass(frozen=True)
+class RustDistArchive:
+    """An extracted Rust dist archive.
+
+    The digest contains a single directory named after the archive, which holds one directory per
+    component and a `components` file listing them.
+    """
+
+    name: str
+    components: tuple[str, ...]
+    digest: Digest
+
+    def component_dir(self, component: str, target: str) -> str:
+        """Find the directory for a rustup component name, such as `rustfmt` or `rust-std`."""
+        for candidate in (component, f"{component}-preview", f"{component}-{target}"):
+            if candidate in self.components:
+                return f"{self.name}/{candidate}"
+
+        raise ValueError(
+            f"The dist archive {self.name} does not contain the component {component!r}. Available"
+            f" components: {', '.join(self.components)}."
+        )
+
+
+def parse_known_dist_archives(known_dist_archives: list[str]) -> dict[str, FileDigest]:
+    known = {}
+    for entry in known_dist_archives:
+        try:
+            name, sha256, length = (part.strip() for part in entry.split("|"))
+            known[name] = FileDigest(sha256, int(length))
+        except ValueError:
+            raise ValueError(
+                f"Bad value for [rustup].known_dist_archives: {entry}. Expected"
+                " `<archive_name>|<sha256>|<length>`."
+            )
+
+    return known
+
+
+@rule(desc="Download Rust dist archive", level=LogLevel.DEBUG)
+async def download_rust_dist_archive(
+    request: RustDistArchiveRequest, rustup: RustupTool
+) -> RustDistArchive:
+    known = parse_known_dist_archives(rustup.known_dist_archives)
+    if request.name not in known:
+        raise UnknownDistArchiveError(
+            f"No known digest for the Rust dist archive {request.name}. Add an entry of the form"
+            f" `{request.name}|<sha256>|<length>` to [rustup].known_dist_archives."
+        )
+
+    url = f"{rustup.dist_server_url}/dist/{request.name}.tar.xz"
+    downloaded = await Get(Digest, DownloadFile(url, known[request.name]))
+    extracted = await Get(ExtractedArchive, MaybeExtractArchiveRequest(downloaded))
+
+    contents = await Get(
+        DigestContents,
+        DigestSubset(extracted.digest, PathGlobs([f"{request.name}/components"])),
+    )
+
+    return RustDistArchive(
+        name=request.name,
+        components=tuple(contents[0].content.decode().split()),
+        digest=extracted.digest,
+    )
+
+
+def rules():
+    return [
+        *collect_rules(),
+        *archive.rules(),
+    ]
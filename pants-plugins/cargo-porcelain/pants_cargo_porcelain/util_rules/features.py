@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+from pants.engine.target import Target
+
+from pants_cargo_porcelain.target_types import (
+    CargoAllFeaturesField,
+    CargoDefaultFeaturesField,
+    CargoFeaturesField,
+)
+
+
+@dataclass(frozen=True)
+class CargoFeatures:
+    """The feature selection of a cargo target."""
+
+    features: tuple[str, ...] = ()
+    default_features: bool = True
+    all_features: bool = False
+
+    @classmethod
+    def from_fields(
+        cls,
+        features: CargoFeaturesField,
+        default_features: CargoDefaultFeaturesField,
+        all_features: CargoAllFeaturesField,
+    ) -> CargoFeatures:
+        return cls(
+            features=tuple(sorted(set(features.value or ()))),
+            default_features=default_features.value,
+            all_features=all_features.value,
+        )
+
+    @classmethod
+    def from_target(cls, target: Target) -> CargoFeatures:
+        return cls.from_fields(
+            target.get(CargoFeaturesField),
+            target.get(CargoDefaultFeaturesField),
+            target.get(CargoAllFeaturesField),
+        )
+
+    @property
+    def args(self) -> tuple[str, ...]:
+        args = []
+        if self.all_features:
+            args.append("--all-features")
+        if not self.default_features:
+            args.append("--no-default-features")
+        if self.features:
+            args.append(f"--features={','.join(self.features)}")
+        return tuple(args)
+
+    @property
+    def cache_key(self) -> str | None:
+        """A short key for the target cache path, or None for the default features.
+
+        Feature sets build into separate target directories, because cargo rebuilds a crate and
+        everything that depends on it whenever its features change.
+        """
+        if not self.args:
+            return None
+
+        return hashlib.sha256(" ".join(self.args).encode()).hexdigest()[:12]
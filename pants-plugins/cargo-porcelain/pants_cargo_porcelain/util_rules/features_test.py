@@ -0,0 +1,26 @@
+import pytest
+
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
+
+
+@pytest.mark.parametrize(
+    "features, expected",
+    [
+        (CargoFeatures(), ()),
+        (CargoFeatures(features=("a", "b")), ("--features=a,b",)),
+        (CargoFeatures(default_features=False), ("--no-default-features",)),
+        (
+            CargoFeatures(features=("a",), default_features=False, all_features=True),
+            ("--all-features", "--no-default-features", "--features=a"),
+        ),
+    ],
+)
+def test_args(features, expected):
+    assert features.args == expected
+
+
+def test_cache_key():
+    assert CargoFeatures().cache_key is None
+    assert CargoFeatures(features=("a",)).cache_key == CargoFeatures(features=("a",)).cache_key
+    assert CargoFeatures(features=("a",)).cache_key != CargoFeatures(features=("b",)).cache_key
+    assert len(CargoFeatures(all_features=True).cache_key) == 12
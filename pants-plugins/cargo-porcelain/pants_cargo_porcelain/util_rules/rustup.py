@@ -1,18 +1,38 @@
-import fcntl
+from __future__ import annotations
+
 import os
-import time
 from dataclasses import dataclass
+from typing import ClassVar
 
-from pants.base.build_environment import get_pants_cachedir
+import toml
+from pants.core.util_rules import adhoc_binaries
+from pants.core.util_rules.adhoc_binaries import PythonBuildStandaloneBinary
 from pants.core.util_rules.external_tool import DownloadedExternalTool, ExternalToolRequest
-from pants.engine.fs import EMPTY_DIGEST
+from pants.engine.addresses import Address
+from pants.engine.fs import (
+    EMPTY_DIGEST,
+    CreateDigest,
+    Digest,
+    DigestContents,
+    DigestSubset,
+    FileContent,
+    MergeDigests,
+    PathGlobs,
+    RemovePrefix,
+)
 from pants.engine.platform import Platform
-from pants.engine.process import Process, ProcessResult
-from pants.engine.rules import Get, collect_rules, rule
+from pants.engine.process import Process, ProcessCacheScope, ProcessResult
+from pants.engine.rules import Get, MultiGet, collect_rules, rule
+from pants.engine.target import WrappedTarget, WrappedTargetRequest
+from pants.engine.unions import UnionMembership, UnionRule, union
 from pants.util.frozendict import FrozenDict
 from pants.util.logging import LogLevel
 
+from pants_cargo_porcelain.internal.platform import platform_to_target
 from pants_cargo_porcelain.subsystems import RustupTool
+from pants_cargo_porcelain.target_types import CargoRustVersionField
+from pants_cargo_porcelain.util_rules import dist
+from pants_cargo_porcelain.util_rules.dist import RustDistArchive, RustDistArchiveRequest
 
 RUSTUP_NAMED_CACHE = ".rustup"
 RUSTUP_APPEND_ONLY_CACHES = FrozenDict({"rustup": RUSTUP_NAMED_CACHE})
@@ -23,11 +43,60 @@ CARGO_APPEND_ONLY_CACHES = FrozenDict({"cargo": CARGO_NAMED_CACHE})
 BOTH_CACHES = FrozenDict({**RUSTUP_APPEND_ONLY_CACHES, **CARGO_APPEND_ONLY_CACHES})
 
 
+def rustup_env(rustup: RustupTool) -> dict[str, str]:
+    """The environment for running rustup against the named caches and configured dist server."""
+    return {
+        "RUSTUP_HOME": RUSTUP_NAMED_CACHE,
+        "CARGO_HOME": CARGO_NAMED_CACHE,
+        "RUSTUP_DIST_SERVER": rustup.dist_server_url,
+        "RUSTUP_UPDATE_ROOT": f"{rustup.dist_server_url}/rustup",
+    }
+
+
+@union
+class RustToolchainComponents:
+    """Components that a backend needs installed in every Rust toolchain.
+
+    All toolchain requests are widened to the union of the components declared by the enabled
+    backends, so that every goal resolves the same toolchain.
+    """
+
+    components: ClassVar[tuple[str, ...]]
+
+
+class CoreRustToolchainComponents(RustToolchainComponents):
+    components = ("cargo", "rustfmt")
+
+
 @dataclass(frozen=True)
 class RustToolchainRequest:
+    version: str
+    target: str
+    components: tuple[str, ...] = ()
+    # Additional targets to install the standard library for, to cross-compile.
+    cross_targets: tuple[str, ...] = ()
+
+    def __str__(self) -> str:
+        return f"rust-{self.version}-{self.target}"
+
+
+@dataclass(frozen=True)
+class _ProvisionRustToolchainRequest:
+    version: str
+    target: str
+    components: tuple[str, ...]
+    cross_targets: tuple[str, ...] = ()
+
+    def __str__(self) -> str:
+        return f"rust-{self.version}-{self.target}"
+
+
+@dataclass(frozen=True)
+class _HermeticRustToolchainRequest:
     version: str
     target: str
     components: tuple[str, ...]
+    cross_targets: tuple[str, ...] = ()
 
     def __str__(self) -> str:
         return f"rust-{self.version}-{self.target}"
@@ -41,10 +110,20 @@ class RustToolchain:
 
     ok: bool
 
+    # Set for hermetic toolchains, which are mounted at `path` instead of living in a named cache.
+    digest: Digest = EMPTY_DIGEST
+
     @property
     def cargo(self) -> str:
         return f"{self.path}/bin/cargo"
 
+    @property
+    def immutable_input_digests(self) -> FrozenDict[str, Digest]:
+        if self.digest == EMPTY_DIGEST:
+            return FrozenDict()
+
+        return FrozenDict({self.path: self.digest})
+
 
 @dataclass(frozen=True)
 class RustupBinary:
@@ -71,109 +150,308 @@ async def get_rustup_binary(
             description="Installing Rustup",
             level=LogLevel.DEBUG,
             append_only_caches=BOTH_CACHES,
-            env={"RUSTUP_HOME": RUSTUP_NAMED_CACHE, "CARGO_HOME": CARGO_NAMED_CACHE},
+            env=rustup_env(rustup),
         ),
     )
 
     return RustupBinary(path=f"{CARGO_NAMED_CACHE}/bin/rustup")
 
 
-class FileLock:
-    def __init__(self, path: str):
-        directory = os.path.dirname(path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
+_RUSTUP_STATE_DIR = f"{RUSTUP_NAMED_CACHE}/.pants"
+
+# Installs a toolchain with all requested targets and components in a single rustup invocation. A
+# small manifest next to the toolchain records what has been installed, so the common case where
+# everything is already present never starts rustup. The lock is taken by the sandboxed process
+# rather than the rule, so waiting for it never blocks the engine, and the kernel releases it if
+# the process dies.
+_PROVISION_SCRIPT_PATH = "__rustup_provision.py"
+_PROVISION_SCRIPT = """\
+import fcntl
+import json
+import os
+import subprocess
+import sys
+
+rustup, state_path, toolchain_dir, version, targets, *components = sys.argv[1:]
+targets = targets.split(",")
+manifest_path = f"{state_path}.json"
+
+
+def is_installed():
+    if not os.path.isdir(toolchain_dir):
+        return False
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return set(targets) <= set(manifest["targets"]) and set(components) <= set(
+        manifest["components"]
+    )
+
+
+if is_installed():
+    sys.exit(0)
+
+os.makedirs(os.path.dirname(state_path), exist_ok=True)
+with open(f"{state_path}.lock", "a") as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    if is_installed():
+        sys.exit(0)
+
+    argv = [rustup, "toolchain", "install", "--no-self-update", "--profile=minimal"]
+    argv.append(f"--target={','.join(targets)}")
+    if components:
+        argv.append(f"--component={','.join(components)}")
+    argv.append(version)
+
+    returncode = subprocess.call(argv)
+    if returncode != 0:
+        sys.exit(returncode)
 
-        open_mode = os.O_RDWR | os.O_CREAT | os.O_TRUNC
-        fd = os.open(path, open_mode)
-        self._fd = fd
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {"targets": [], "components": []}
 
-    def __enter__(self):
-        fcntl.flock(self._fd, fcntl.LOCK_EX)
-        return self
+    manifest["targets"] = sorted(set(manifest["targets"]) | set(targets))
+    manifest["components"] = sorted(set(manifest["components"]) | set(components))
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+"""
+
+
+@dataclass(frozen=True)
+class RustupProvisionScript:
+    """A helper that installs toolchains into the shared rustup cache at most once."""
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self._fd:
-            fcntl.flock(self._fd, fcntl.LOCK_UN)
-            os.close(self._fd)
+    python: PythonBuildStandaloneBinary
+    digest: Digest
 
-        self._fd = None
+
+@dataclass(frozen=True)
+class RustupProvisionScriptRequest:
+    pass
+
+
+@rule(desc="Prepare rustup provisioning script", level=LogLevel.DEBUG)
+async def get_rustup_provision_script(
+    req: RustupProvisionScriptRequest, python: PythonBuildStandaloneBinary
+) -> RustupProvisionScript:
+    digest = await Get(
+        Digest,
+        CreateDigest([FileContent(_PROVISION_SCRIPT_PATH, _PROVISION_SCRIPT.encode())]),
+    )
+    return RustupProvisionScript(python, digest)
 
 
 @rule(desc="Get Rust toolchain", level=LogLevel.DEBUG)
-async def get_rust_toolchain(request: RustToolchainRequest) -> RustToolchain:
-    rustup_binary = await Get(RustupBinary, RustupBinaryRequest())
-
-    lock_file_path = os.path.join(get_pants_cachedir(), "locks", ".rustup")
-    with FileLock(lock_file_path):
-        time.sleep(0.1)
-        _ = await Get(
-            ProcessResult,
-            Process(
-                argv=[
-                    rustup_binary.path,
-                    "toolchain",
-                    "install",
-                    "--no-self-update",
-                    request.version,
-                ],
-                input_digest=EMPTY_DIGEST,
-                description=f"Installing Rust {request.version}",
-                level=LogLevel.DEBUG,
-                append_only_caches=BOTH_CACHES,
-                env={"RUSTUP_HOME": RUSTUP_NAMED_CACHE, "CARGO_HOME": CARGO_NAMED_CACHE},
+async def get_rust_toolchain(
+    request: RustToolchainRequest, rustup: RustupTool, union_membership: UnionMembership
+) -> RustToolchain:
+    components = set(request.components)
+    for member in union_membership.get(RustToolchainComponents):
+        components.update(member.components)
+
+    if rustup.hermetic_toolchains:
+        return await Get(
+            RustToolchain,
+            _HermeticRustToolchainRequest(
+                request.version,
+                request.target,
+                tuple(sorted(components)),
+                tuple(sorted(request.cross_targets)),
             ),
         )
-        time.sleep(0.1)
-        _ = await Get(
-            ProcessResult,
-            Process(
-                argv=[
-                    rustup_binary.path,
-                    "target",
-                    "add",
-                    f"--toolchain={request.version}",
-                    request.target,
-                ],
-                input_digest=EMPTY_DIGEST,
-                description=f"Installing target {request.target} for toolchain {request.version}",
-                level=LogLevel.DEBUG,
-                append_only_caches=BOTH_CACHES,
-                env={"RUSTUP_HOME": RUSTUP_NAMED_CACHE, "CARGO_HOME": CARGO_NAMED_CACHE},
+
+    return await Get(
+        RustToolchain,
+        _ProvisionRustToolchainRequest(
+            request.version,
+            request.target,
+            tuple(sorted(components)),
+            tuple(sorted(request.cross_targets)),
+        ),
+    )
+
+
+@rule(desc="Build hermetic Rust toolchain", level=LogLevel.DEBUG)
+async def build_hermetic_rust_toolchain(request: _HermeticRustToolchainRequest) -> RustToolchain:
+    # The standard libraries of other targets are only shipped as separate `rust-std` archives.
+    archive, *cross_archives = await MultiGet(
+        Get(RustDistArchive, RustDistArchiveRequest(name))
+        for name in (
+            str(request),
+            *(f"rust-std-{request.version}-{target}" for target in request.cross_targets),
+        )
+    )
+
+    component_dirs = [
+        (archive, component_dir)
+        for component_dir in sorted({
+            archive.component_dir(component, request.target)
+            for component in ("rustc", "rust-std", *request.components)
+        })
+    ]
+    component_dirs.extend(
+        (cross_archive, cross_archive.component_dir("rust-std", target))
+        for cross_archive, target in zip(cross_archives, request.cross_targets)
+    )
+    component_digests = await MultiGet(
+        Get(
+            Digest,
+            DigestSubset(
+                component_archive.digest,
+                PathGlobs([f"{component_dir}/**", f"!{component_dir}/manifest.in"]),
             ),
         )
-        time.sleep(0.1)
-        if request.components:
-            _ = await Get(
-                ProcessResult,
-                Process(
-                    argv=[
-                        rustup_binary.path,
-                        "component",
-                        "add",
-                        f"--toolchain={request.version}",
-                        *request.components,
-                    ],
-                    input_digest=EMPTY_DIGEST,
-                    description=(
-                        f"Installing components {request.components} for toolchain"
-                        f" {request.version}"
-                    ),
-                    level=LogLevel.DEBUG,
-                    append_only_caches=BOTH_CACHES,
-                    env={"RUSTUP_HOME": RUSTUP_NAMED_CACHE, "CARGO_HOME": CARGO_NAMED_CACHE},
-                ),
-            )
-
-        return RustToolchain(
-            path=f"{RUSTUP_NAMED_CACHE}/toolchains/{request.version}-{request.target}",
-            version=request.version,
-            target=request.target,
-            ok=True,
+        for component_archive, component_dir in component_dirs
+    )
+    stripped_digests = await MultiGet(
+        Get(Digest, RemovePrefix(digest, component_dir))
+        for digest, (_, component_dir) in zip(component_digests, component_dirs)
+    )
+    digest = await Get(Digest, MergeDigests(stripped_digests))
+
+    return RustToolchain(
+        path=f".rust-toolchain/{request.version}-{request.target}",
+        version=request.version,
+        target=request.target,
+        ok=True,
+        digest=digest,
+    )
+
+
+@rule(desc="Provision Rust toolchain", level=LogLevel.DEBUG)
+async def provision_rust_toolchain(
+    request: _ProvisionRustToolchainRequest, rustup: RustupTool
+) -> RustToolchain:
+    rustup_binary, script = await MultiGet(
+        Get(RustupBinary, RustupBinaryRequest()),
+        Get(RustupProvisionScript, RustupProvisionScriptRequest()),
+    )
+
+    toolchain_path = f"{RUSTUP_NAMED_CACHE}/toolchains/{request.version}-{request.target}"
+    _ = await Get(
+        ProcessResult,
+        Process(
+            argv=[
+                script.python.path,
+                _PROVISION_SCRIPT_PATH,
+                rustup_binary.path,
+                f"{_RUSTUP_STATE_DIR}/{request}",
+                toolchain_path,
+                request.version,
+                ",".join((request.target, *request.cross_targets)),
+                *request.components,
+            ],
+            input_digest=script.digest,
+            description=f"Provisioning Rust {request.version} for {request.target}",
+            level=LogLevel.DEBUG,
+            append_only_caches=FrozenDict({**BOTH_CACHES, **script.python.APPEND_ONLY_CACHES}),
+            immutable_input_digests=script.python.immutable_input_digests,
+            env=rustup_env(rustup),
+            cache_scope=ProcessCacheScope.PER_RESTART_SUCCESSFUL,
+        ),
+    )
+
+    return RustToolchain(
+        path=toolchain_path,
+        version=request.version,
+        target=request.target,
+        ok=True,
+    )
+
+
+@dataclass(frozen=True)
+class CargoToolchainRequest:
+    """A request for the toolchain a specific Cargo target is pinned to."""
+
+    address: Address
+    cross_targets: tuple[str, ...] = ()
+
+
+def parse_rust_toolchain_file(content: str) -> tuple[str | None, tuple[str, ...]]:
+    """Parse the channel and components from a `rust-toolchain.toml` or `rust-toolchain` file."""
+    try:
+        toolchain = toml.loads(content).get("toolchain", {})
+    except toml.TomlDecodeError:
+        # The legacy format is just the channel name.
+        return content.strip() or None, ()
+
+    return toolchain.get("channel"), tuple(toolchain.get("components", ()))
+
+
+@dataclass(frozen=True)
+class RustToolchainPinRequest:
+    """A request for the toolchain of a directory, given the version pinned on its target."""
+
+    spec_path: str
+    rust_version: str | None = None
+    cross_targets: tuple[str, ...] = ()
+
+
+@rule(desc="Resolve Rust toolchain for target", level=LogLevel.DEBUG)
+async def resolve_cargo_toolchain(request: CargoToolchainRequest) -> RustToolchain:
+    wrapped_target = await Get(
+        WrappedTarget,
+        WrappedTargetRequest(request.address, description_of_origin="<cargo toolchain>"),
+    )
+
+    return await Get(
+        RustToolchain,
+        RustToolchainPinRequest(
+            request.address.spec_path,
+            wrapped_target.target.get(CargoRustVersionField).value,
+            request.cross_targets,
+        ),
+    )
+
+
+@rule(desc="Resolve pinned Rust toolchain", level=LogLevel.DEBUG)
+async def resolve_pinned_toolchain(
+    request: RustToolchainPinRequest, rustup: RustupTool, platform: Platform
+) -> RustToolchain:
+    version = request.rust_version
+    components: tuple[str, ...] = ()
+    if not version:
+        directories = [request.spec_path]
+        while directories[-1]:
+            directories.append(os.path.dirname(directories[-1]))
+
+        toolchain_files = await Get(
+            DigestContents,
+            PathGlobs([
+                os.path.join(directory, name)
+                for directory in directories
+                for name in ("rust-toolchain.toml", "rust-toolchain")
+            ]),
         )
 
+        # The nearest file wins, and `rust-toolchain.toml` wins over `rust-toolchain`.
+        for file_content in sorted(
+            toolchain_files, key=lambda fc: (-fc.path.count("/"), not fc.path.endswith(".toml"))
+        ):
+            version, components = parse_rust_toolchain_file(file_content.content.decode())
+            break
+
+    return await Get(
+        RustToolchain,
+        RustToolchainRequest(
+            version or rustup.rust_version,
+            platform_to_target(platform),
+            components,
+            request.cross_targets,
+        ),
+    )
+
 
 def rules():
     return [
         *collect_rules(),
+        *adhoc_binaries.rules(),
+        *dist.rules(),
+        UnionRule(RustToolchainComponents, CoreRustToolchainComponents),
     ]
@@ -0,0 +1,132 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from pants_cargo_porcelain.util_rules.rustup import _PROVISION_SCRIPT, parse_rust_toolchain_file
+
+
+@pytest.mark.parametrize(
+    "content,expected",
+    (
+        ('[toolchain]\nchannel = "1.72.1"\n', ("1.72.1", ())),
+        (
+            '[toolchain]\nchannel = "nightly-2023-09-01"\ncomponents = ["clippy", "rust-src"]\n',
+            ("nightly-2023-09-01", ("clippy", "rust-src")),
+        ),
+        ('[toolchain]\nprofile = "minimal"\n', (None, ())),
+        ("1.72.1\n", ("1.72.1", ())),
+        ("stable", ("stable", ())),
+    ),
+)
+def test_parse_rust_toolchain_file(content, expected) -> None:
+    assert parse_rust_toolchain_file(content) == expected
+
+
+def write_fake_rustup(tmp_path, toolchain_dir, returncode: int = 0, delay: float = 0):
+    """A fake `rustup` that records its arguments and creates the toolchain directory."""
+    rustup = tmp_path / "rustup"
+    rustup.write_text(
+        "#!/usr/bin/env bash\n"
+        f'echo "$*" >> {tmp_path}/calls\n'
+        f"sleep {delay}\n"
+        f"mkdir -p {toolchain_dir}\n"
+        f"exit {returncode}\n"
+    )
+    rustup.chmod(0o755)
+    return rustup
+
+
+def read_calls(tmp_path) -> list[str]:
+    calls = tmp_path / "calls"
+    return calls.read_text().splitlines() if calls.exists() else []
+
+
+def provision_argv(tmp_path, rustup, targets: str, *components: str) -> list[str]:
+    return [
+        sys.executable,
+        "-c",
+        _PROVISION_SCRIPT,
+        str(rustup),
+        str(tmp_path / "state" / "1.72.1"),
+        str(tmp_path / "toolchains" / "1.72.1"),
+        "1.72.1",
+        targets,
+        *components,
+    ]
+
+
+def provision(tmp_path, rustup, targets: str, *components: str) -> int:
+    return subprocess.run(provision_argv(tmp_path, rustup, targets, *components)).returncode
+
+
+def read_manifest(tmp_path) -> dict:
+    return json.loads((tmp_path / "state" / "1.72.1.json").read_text())
+
+
+def test_provision_installs_once(tmp_path) -> None:
+    rustup = write_fake_rustup(tmp_path, tmp_path / "toolchains" / "1.72.1")
+
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu", "clippy", "rustfmt") == 0
+    # Everything is in the manifest, so the warm path does not start rustup.
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu", "clippy") == 0
+
+    assert read_calls(tmp_path) == [
+        "toolchain install --no-self-update --profile=minimal"
+        " --target=x86_64-unknown-linux-gnu --component=clippy,rustfmt 1.72.1"
+    ]
+    assert read_manifest(tmp_path) == {
+        "targets": ["x86_64-unknown-linux-gnu"],
+        "components": ["clippy", "rustfmt"],
+    }
+
+
+def test_provision_installs_missing_targets_and_components(tmp_path) -> None:
+    rustup = write_fake_rustup(tmp_path, tmp_path / "toolchains" / "1.72.1")
+
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu", "clippy") == 0
+    assert (
+        provision(tmp_path, rustup, "x86_64-unknown-linux-gnu,wasm32-unknown-unknown", "rustfmt")
+        == 0
+    )
+
+    assert read_calls(tmp_path)[1:] == [
+        "toolchain install --no-self-update --profile=minimal"
+        " --target=x86_64-unknown-linux-gnu,wasm32-unknown-unknown --component=rustfmt 1.72.1"
+    ]
+    assert read_manifest(tmp_path) == {
+        "targets": ["wasm32-unknown-unknown", "x86_64-unknown-linux-gnu"],
+        "components": ["clippy", "rustfmt"],
+    }
+
+
+def test_provision_reinstalls_removed_toolchain(tmp_path) -> None:
+    toolchain_dir = tmp_path / "toolchains" / "1.72.1"
+    rustup = write_fake_rustup(tmp_path, toolchain_dir)
+
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu") == 0
+    toolchain_dir.rmdir()
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu") == 0
+
+    assert len(read_calls(tmp_path)) == 2
+
+
+def test_provision_failure_is_not_recorded(tmp_path) -> None:
+    rustup = write_fake_rustup(tmp_path, tmp_path / "toolchains" / "1.72.1", returncode=3)
+
+    assert provision(tmp_path, rustup, "x86_64-unknown-linux-gnu") == 3
+    assert not (tmp_path / "state" / "1.72.1.json").exists()
+
+
+def test_concurrent_provisions_install_once(tmp_path) -> None:
+    rustup = write_fake_rustup(tmp_path, tmp_path / "toolchains" / "1.72.1", delay=0.5)
+
+    # The second process waits for the lock, and then finds the toolchain installed.
+    processes = [
+        subprocess.Popen(provision_argv(tmp_path, rustup, "x86_64-unknown-linux-gnu"))
+        for _ in range(2)
+    ]
+
+    assert [process.wait() for process in processes] == [0, 0]
+    assert len(read_calls(tmp_path)) == 1
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import logging
 from dataclasses import dataclass
 
@@ -9,7 +11,9 @@ from pants.engine.rules import Get, MultiGet, collect_rules, rule
 from pants.engine.target import AllTargets, MultipleSourcesField, Target, Targets
 from pants.option.global_options import UnmatchedBuildFileGlobs
 from pants.util.frozendict import FrozenDict
+from pants.util.logging import LogLevel
 
+from pants_cargo_porcelain.subsystems import cargo_profile_dir
 from pants_cargo_porcelain.target_types import (
     CargoPackageTargetImpl,
     CargoSourcesTarget,
@@ -18,6 +22,7 @@ from pants_cargo_porcelain.target_types import (
     _CargoPackageMarker,
     _CargoSourcesMarker,
 )
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
 
 logger = logging.getLogger(__name__)
 
@@ -105,6 +110,16 @@ class CargoPackageMapping:
 
         raise ValueError(f"target {target.address} is not a workspace")
 
+    def workspace_for_address(self, address: Address) -> Address | None:
+        """The workspace of the package that `address` or its generator belongs to, if any."""
+        generator = address.maybe_convert_to_target_generator()
+        for workspace, members in self.workspace_to_packages.items():
+            for m in members:
+                if generator == m.package.address.maybe_convert_to_target_generator():
+                    return workspace
+
+        return None
+
 
 @rule(desc="Assign packages to workspaces")
 async def assign_packages_to_workspaces(
@@ -171,6 +186,48 @@ async def assign_packages_to_workspaces(
     )
 
 
+@dataclass(frozen=True)
+class CargoTargetCachePathRequest:
+    address: Address
+    profile: str = "dev"
+    target_triple: str | None = None
+    features: CargoFeatures = CargoFeatures()
+    # Keeps artifacts that would invalidate those of regular builds apart, such as `clippy`.
+    qualifier: str | None = None
+
+
+@dataclass(frozen=True)
+class CargoTargetCachePath:
+    """The `cache_path` of the target directory a package builds into.
+
+    All members of a workspace share the target directory of the workspace, so that common
+    dependencies are only compiled once. Cargo locks the target directory, so concurrent builds
+    of different members wait for each other instead of corrupting it.
+
+    Profiles that cargo builds into different directories also get their own target directories,
+    so that building one profile never waits on or evicts another. The same goes for every target
+    triple that is cross-compiled for, and every non-default feature selection.
+    """
+
+    path: str
+
+
+@rule(desc="Find the cargo target directory for a package", level=LogLevel.DEBUG)
+async def get_cargo_target_cache_path(
+    request: CargoTargetCachePathRequest, package_mapping: CargoPackageMapping
+) -> CargoTargetCachePath:
+    workspace = package_mapping.workspace_for_address(request.address)
+    spec_path = request.address.spec_path if workspace is None else workspace.spec_path
+    path = f"{spec_path}@{cargo_profile_dir(request.profile)}"
+    if request.target_triple:
+        path = f"{path}-{request.target_triple}"
+    if request.features.cache_key:
+        path = f"{path}+{request.features.cache_key}"
+    if request.qualifier:
+        path = f"{path}~{request.qualifier}"
+    return CargoTargetCachePath(path)
+
+
 def rules():
     return [
         *collect_rules(),
@@ -21,9 +21,12 @@ from pants_cargo_porcelain.tool import rules as tool_rules
 from pants_cargo_porcelain.tool_rules import rules as tool_rules_rules
 from pants_cargo_porcelain.tools.mtime import rules as mtime_rules
 from pants_cargo_porcelain.util_rules import cargo, rustup, workspace
+from pants_cargo_porcelain.util_rules.features import CargoFeatures
 from pants_cargo_porcelain.util_rules.workspace import (
     AllCargoTargets,
     CargoPackageMapping,
+    CargoTargetCachePath,
+    CargoTargetCachePathRequest,
     CargoWorkspaceMember,
 )
 
@@ -45,6 +48,7 @@ def rule_runner() -> RuleRunner:
             *mtime_rules(),
             QueryRule(AllCargoTargets, []),
             QueryRule(CargoPackageMapping, []),
+            QueryRule(CargoTargetCachePath, [CargoTargetCachePathRequest]),
         ],
         target_types=[CargoPackageTargetImpl, CargoWorkspaceTarget, CargoPackageTarget],
     )
@@ -133,3 +137,36 @@ edition = "2021"
         ),
         set(),
     )
+
+
+def test_workspace_members_share_target_cache_path(rule_runner: RuleRunner) -> None:
+    rule_runner.write_files({
+        "ws/BUILD": 'cargo_workspace(name="workspace")',
+        "ws/Cargo.toml": '[workspace]\nmembers = ["member"]',
+        "ws/member/BUILD": "cargo_package()",
+        "ws/member/Cargo.toml": '[package]\nname = "member"\nversion = "0.1.0"',
+        "ws/member/src/main.rs": "fn main() {}",
+        "loose/BUILD": "cargo_package()",
+        "loose/Cargo.toml": '[package]\nname = "loose"\nversion = "0.1.0"',
+        "loose/src/main.rs": "fn main() {}",
+    })
+
+    def cache_path(address: Address, **kwargs) -> str:
+        return rule_runner.request(
+            CargoTargetCachePath, [CargoTargetCachePathRequest(address, **kwargs)]
+        ).path
+
+    member = Address("ws/member", target_name="member", generated_name="member")
+    loose = Address("loose", target_name="loose", generated_name="loose")
+    features = CargoFeatures(features=("extra",))
+
+    assert cache_path(member) == "ws@debug"
+    assert cache_path(loose) == "loose@debug"
+    assert cache_path(member, profile="test") == "ws@debug"
+    assert cache_path(member, profile="release-lto") == "ws@release-lto"
+    assert (
+        cache_path(member, profile="release", target_triple="x86_64-unknown-linux-musl")
+        == "ws@release-x86_64-unknown-linux-musl"
+    )
+    assert cache_path(member, features=features) == f"ws@debug+{features.cache_key}"
+    assert cache_path(member, qualifier="clippy") == "ws@debug~clippy"